@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import math
+import wave
+import hashlib
+import argparse
+import importlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'manifest.json')
+
+def load_player_class(spec: str):
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
+def asset_name(spec: str, params: dict, start: float, stop: float, mode: str) -> str:
+    payload = json.dumps([spec, sorted(params.items()), start, stop, mode])
+    class_name = spec.partition(':')[2].lower()
+    return f"{class_name}-{hashlib.sha1(payload.encode()).hexdigest()[:12]}.wav"
+
+def render_asset(job: tuple) -> dict:
+    spec, params, start, stop, mode, out_dir = job
+    player = load_player_class(spec)(**params)
+    path = os.path.join(out_dir, asset_name(spec, params, start, stop, mode))
+    if mode == 'export':
+        player.export(start, stop, path)
+    else:
+        pcm = player.render(start, stop)
+        with wave.open(path, 'wb') as wf:
+            wf.setnchannels(2)
+            wf.setsampwidth(2)
+            wf.setframerate(player.rate)
+            wf.writeframes(pcm)
+    with wave.open(path, 'rb') as wf:
+        frames = wf.getnframes()
+    return {
+        'file': os.path.basename(path),
+        'player': spec,
+        'params': params,
+        'start': start,
+        'stop': stop,
+        'mode': mode,
+        'rate': player.rate,
+        'frames': frames,
+    }
+
+class AssetManifest:
+    """Pre-rendered Player assets that can be loaded instead of rendered live"""
+    def __init__(self, path: str = DEFAULT_MANIFEST):
+        self.path = path
+        self.assets = []
+        if os.path.exists(path):
+            with open(path) as f:
+                self.assets = json.load(f).get('assets', [])
+
+    def find(self, spec: str, params: dict, start: float, stop: float, mode: str = 'render'):
+        """Path of a matching asset, parameters are compared with float tolerance"""
+        for asset in self.assets:
+            if asset['player'] != spec or asset['mode'] != mode or set(asset['params']) != set(params):
+                continue
+            values = [(asset['start'], start), (asset['stop'], stop)] + [(asset['params'][k], v) for k, v in params.items()]
+            if all(math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12) for a, b in values):
+                return os.path.join(os.path.dirname(self.path), asset['file'])
+        return None
+
+def parse_param(text: str):
+    name, _, values = text.partition('=')
+    if not name or not values:
+        raise argparse.ArgumentTypeError(f"expected name=v1,v2,... got {text!r}")
+    return name, [parse_value(v) for v in values.split(',')]
+
+def parse_value(text: str):
+    # Sizes and sample rates such as periodsize or rate must stay integers
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a parameter grid of Player sounds to WAV files in parallel')
+    parser.add_argument('--player', default='player:BeePlayer', help='module:Class of a Player subclass')
+    parser.add_argument('--param', type=parse_param, action='append', default=[],
+                        help='constructor parameter grid, e.g. d=3,5,8 or omega=1382.3 (omega is 2*pi*frequency)')
+    parser.add_argument('--start', type=float, default=-0.02)
+    parser.add_argument('--stop', type=float, default=0.02)
+    parser.add_argument('--mode', choices=['render', 'export'], default='render',
+                        help='render: trimmed like live playback, export: raw signal from start to stop')
+    parser.add_argument('--out', default=os.path.dirname(DEFAULT_MANIFEST))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    names = [name for name, _ in args.param]
+    grid = [dict(zip(names, combo)) for combo in itertools.product(*[values for _, values in args.param])]
+    jobs = [(args.player, params, args.start, args.stop, args.mode, args.out) for params in grid]
+
+    manifest_path = os.path.join(args.out, 'manifest.json')
+    manifest = AssetManifest(manifest_path)
+    rendered = {asset['file']: asset for asset in manifest.assets}
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for asset in executor.map(render_asset, jobs):
+            rendered[asset['file']] = asset
+            print(f"{asset['file']}: {asset['params']} {asset['frames']} frames", file=sys.stderr)
+
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'assets': sorted(rendered.values(), key=lambda a: a['file'])}, f, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    print(f"Wrote {len(jobs)} assets, manifest {manifest_path}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import io
+import os
+import sys
+import time
+import wave
+import threading
+from collections import deque
+
+import pygame
+
+# Mixer buffer (frames) and rate, smaller buffers start sounds sooner but underrun more easily
+AUDIO_PROFILES = {
+    'default': {'frequency': 44100, 'buffer': 512},
+    'low-latency': {'frequency': 48000, 'buffer': 256},
+    'safe': {'frequency': 44100, 'buffer': 1024},
+}
+
+# Effects resampled to the device rate ahead of time live in assets/<rate>/
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+
+def audio_profile() -> dict:
+    name = os.environ.get('RASPITRON_AUDIO_PROFILE', 'default')
+    profile = dict(AUDIO_PROFILES.get(name, AUDIO_PROFILES['default']), name=name)
+    for key, var in (('frequency', 'RASPITRON_AUDIO_RATE'), ('buffer', 'RASPITRON_AUDIO_BUFFER')):
+        try:
+            profile[key] = int(os.environ.get(var, profile[key]))
+        except ValueError:
+            pass
+    return profile
+
+def resampled_path(path: str, rate: int) -> str:
+    return os.path.join(ASSET_DIR, str(rate), os.path.basename(path))
+
+def resample_wav(src: str, dst: str, rate: int):
+    """Linear resampling of a 16-bit WAV so the mixer does not convert it at load"""
+    import numpy as np
+    with wave.open(src, 'rb') as wf:
+        channels, src_rate = wf.getnchannels(), wf.getframerate()
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{src}: only 16-bit WAV files can be resampled")
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype='<i2').reshape(-1, channels)
+    frames = int(round(len(samples) * rate / src_rate))
+    t = np.arange(frames) * src_rate / rate
+    src_t = np.arange(len(samples))
+    out = np.stack([np.interp(t, src_t, samples[:, c]) for c in range(channels)], axis=1)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with wave.open(dst, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(np.round(out).astype('<i2').tobytes())
+
+class AudioEngine:
+    """Single long-lived mixer output shared by effects, beeps and TTS"""
+    _instance = None
+
+    # Music is streamed through pygame.mixer.music and does not need a channel
+    CHANNELS = ['keypress', 'boop', 'beep', 'beep-startup', 'geiger', 'reload', 'tts', 'doppler']
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self, frequency=None, buffer=None):
+        if self._initialized:
+            return
+        self._initialized = True
+
+        self.profile = audio_profile()
+        frequency = frequency or self.profile['frequency']
+        buffer = buffer or self.profile['buffer']
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(frequency=frequency, size=-16, channels=2, buffer=buffer)
+        # The device may have picked its native rate, assets are matched to that
+        self.rate, _, self.output_channels = pygame.mixer.get_init()
+        self.buffer = buffer
+
+        pygame.mixer.set_num_channels(len(self.CHANNELS))
+        # Keep Sound.play() from stealing the named channels
+        pygame.mixer.set_reserved(len(self.CHANNELS))
+        self.channels = {name: pygame.mixer.Channel(i) for i, name in enumerate(self.CHANNELS)}
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+
+    def load(self, source) -> pygame.mixer.Sound:
+        """Load a sound from a path or from encoded audio bytes (wav, mp3, ogg)"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return pygame.mixer.Sound(file=io.BytesIO(source))
+        if os.path.exists(resampled_path(source, self.rate)):
+            source = resampled_path(source, self.rate)
+        return pygame.mixer.Sound(source)
+
+    def pcm_sound(self, pcm: bytes, rate: int, channels: int = 1, sample_width: int = 2) -> pygame.mixer.Sound:
+        """Wrap raw PCM so the mixer converts it to the device format"""
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as wf:
+            wf.setnchannels(channels)
+            wf.setsampwidth(sample_width)
+            wf.setframerate(rate)
+            wf.writeframes(pcm)
+        buf.seek(0)
+        return pygame.mixer.Sound(file=buf)
+
+    def play(self, channel: str, sound, loops: int = 0, requested_at: float = None):
+        if sound is None:
+            return
+        self.channels[channel].play(sound, loops=loops)
+        if requested_at is not None:
+            self._record_latency(time.perf_counter() - requested_at)
+
+    def queue(self, channel: str, sound):
+        """Play after the current sound on the channel, blocking while the queue slot is taken"""
+        ch = self.channels[channel]
+        while ch.get_queue() is not None:
+            time.sleep(0.005)
+        if ch.get_busy():
+            ch.queue(sound)
+        else:
+            ch.play(sound)
+
+    def queue_full(self, channel: str) -> bool:
+        return self.channels[channel].get_queue() is not None
+
+    def play_stream(self, path: str, loops: int = 0):
+        """Stream a long track from disk in small chunks instead of decoding it into memory"""
+        pygame.mixer.music.load(path)
+        pygame.mixer.music.play(loops)
+
+    def stop_stream(self):
+        pygame.mixer.music.stop()
+
+    def stop(self, channel: str = None):
+        if channel is None:
+            pygame.mixer.stop()
+        else:
+            self.channels[channel].stop()
+
+    def pause(self, channel: str):
+        self.channels[channel].pause()
+
+    def unpause(self, channel: str):
+        self.channels[channel].unpause()
+
+    def is_busy(self, channel: str) -> bool:
+        return self.channels[channel].get_busy()
+
+    def wait(self, channel: str, poll: float = 0.01):
+        ch = self.channels[channel]
+        while ch.get_busy() or ch.get_queue() is not None:
+            time.sleep(poll)
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def latency_stats(self) -> dict:
+        """Start latency from request to mixer dispatch, plus the device buffer"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        buffer_ms = 1000 * self.buffer / self.rate
+        if not samples:
+            return {'count': 0, 'buffer_ms': buffer_ms}
+        return {
+            'count': len(samples),
+            'mean_ms': 1000 * sum(samples) / len(samples) + buffer_ms,
+            'p95_ms': 1000 * samples[int(0.95 * (len(samples) - 1))] + buffer_ms,
+            'max_ms': 1000 * samples[-1] + buffer_ms,
+            'buffer_ms': buffer_ms,
+        }
+
+    def print_stats(self):
+        st = self.latency_stats()
+        if st['count']:
+            print(f"[Audio start latency: mean {st['mean_ms']:.1f} ms, p95 {st['p95_ms']:.1f} ms, "
+                  f"max {st['max_ms']:.1f} ms over {st['count']} sounds]", file=sys.stderr)
+
+# Global audio engine instance
+audio = AudioEngine()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import queue
+import socket
+import threading
+import subprocess
+
+VOICE_CMDS = {
+    "krb": "(voice_czech_krb)",
+    "dita": "(voice_czech_dita)",
+    "machac": "(voice_czech_machac)",
+    "ph": "(voice_czech_ph)",
+    "mbrola": '(progn (set! mbrola_progname "/usr/bin/mbrola")(set! czech-mbrola_database "/usr/share/mbrola/cz2/cz2")(require \'czech-mbrola)(voice_czech_mbrola_cz2))',
+}
+
+def get_voice_cmd(voice: str) -> str:
+    return VOICE_CMDS.get(voice, "(voice_czech_krb)")
+
+def encode_text(text: str) -> bytes:
+    return text.encode('iso8859-2', errors='ignore')
+
+def text2wave(text: str, voice_cmd: str) -> bytes:
+    """Synthesize with a fresh text2wave process, returns RIFF wave bytes"""
+    proc = subprocess.run(
+        ['text2wave', '-eval', voice_cmd],
+        input=encode_text(text),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    return proc.stdout
+
+class FestivalError(Exception):
+    pass
+
+class FestivalServer:
+    """A warm `festival --server` process with voices preloaded and one open client connection"""
+    FILE_KEY = b'ft_StUfF_key'
+
+    def __init__(self, port: int, preload_cmds: list, startup_timeout: float = 30.0):
+        self.port = port
+        self.preload_cmds = preload_cmds
+        self.startup_timeout = startup_timeout
+        self.proc = None
+        self.sock = None
+        self.voice_cmd = None
+        self.restarts = 0
+        # Delay before the next start after a failed one, and when that start may happen
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self._buf = bytearray()
+
+    def start(self):
+        self.stop()
+        args = ['festival', '--server',
+                f'(set! server_port {self.port})',
+                "(Parameter.set 'Wavefiletype 'riff)"] + self.preload_cmds
+        self.proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            if self.proc.poll() is not None:
+                raise FestivalError(f"festival server on port {self.port} exited with {self.proc.returncode}")
+            try:
+                self.sock = socket.create_connection(('127.0.0.1', self.port), timeout=1.0)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise FestivalError(f"festival server on port {self.port} did not start")
+                time.sleep(0.1)
+        self.sock.settimeout(30.0)
+        self._buf.clear()
+        # The last preloaded voice is the active one
+        self.voice_cmd = self.preload_cmds[-1] if self.preload_cmds else None
+
+    def restart(self):
+        self.restarts += 1
+        print(f"[Festival server on port {self.port} restarting]", file=sys.stderr)
+        self.start()
+
+    def stop(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=2.0)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self.proc = None
+
+    def _recv(self):
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise FestivalError("festival server closed the connection")
+        self._buf += chunk
+
+    def _read_exact(self, n: int) -> bytes:
+        while len(self._buf) < n:
+            self._recv()
+        data = bytes(self._buf[:n])
+        del self._buf[:n]
+        return data
+
+    def _read_file(self) -> bytes:
+        start = 0
+        while True:
+            idx = self._buf.find(self.FILE_KEY, start)
+            if idx >= 0:
+                break
+            start = max(0, len(self._buf) - len(self.FILE_KEY))
+            self._recv()
+        data = bytes(self._buf[:idx])
+        del self._buf[:idx + len(self.FILE_KEY)]
+        # Occurrences of the key inside the payload are escaped with an X
+        return data.replace(self.FILE_KEY[:-1] + b'X', self.FILE_KEY[:-1])
+
+    def _eval(self, cmd: bytes) -> bytes:
+        self.sock.sendall(cmd + b'\n')
+        wave = b''
+        while True:
+            ack = self._read_exact(3)
+            if ack == b'WV\n':
+                wave = self._read_file()
+            elif ack == b'LP\n':
+                self._read_file()
+            elif ack == b'ER\n':
+                raise FestivalError("festival server returned an error")
+            elif ack == b'OK\n':
+                return wave
+            else:
+                raise FestivalError(f"unexpected festival server reply {ack!r}")
+
+    def synthesize(self, text: str, voice_cmd: str) -> bytes:
+        if self.sock is None:
+            raise FestivalError(f"festival server on port {self.port} is not running")
+        if voice_cmd != self.voice_cmd:
+            self._eval(voice_cmd.encode('ascii'))
+            self.voice_cmd = voice_cmd
+        escaped = encode_text(text).replace(b'\\', b'\\\\').replace(b'"', b'\\"')
+        return self._eval(b'(utt.send.wave.client (utt.synth (Utterance Text "' + escaped + b'")))')
+
+class FestivalServerPool:
+    """Pool of warm festival servers, restarted on crash"""
+    RETRY_MIN = 1.0
+    RETRY_MAX = 60.0
+
+    def __init__(self, size: int = 1, base_port: int = 1314, preload_voices=("machac", "dita")):
+        preload_cmds = [get_voice_cmd(v) for v in preload_voices]
+        self.servers = [FestivalServer(base_port + i, preload_cmds) for i in range(size)]
+        self._idle = queue.Queue()
+        # Set once the first server is up or every start has been tried
+        self._ready = threading.Event()
+        threading.Thread(target=self._start_all, daemon=True).start()
+
+    def _start_all(self):
+        for server in self.servers:
+            try:
+                server.start()
+                self._ready.set()
+            except (OSError, FestivalError) as e:
+                print(f"Failed to start festival server on port {server.port}: {e}", file=sys.stderr)
+                self._fail(server)
+            # Dead servers stay in the pool and are restarted when taken out of it
+            self._idle.put(server)
+        self._ready.set()
+
+    @property
+    def available(self) -> bool:
+        return any(s.sock for s in self.servers)
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        self._ready.wait(timeout)
+        return self.available
+
+    def _fail(self, server):
+        server.stop()
+        server.backoff = min(server.backoff * 2 or self.RETRY_MIN, self.RETRY_MAX)
+        server.retry_at = time.monotonic() + server.backoff
+
+    def _revive(self, server) -> bool:
+        """Restart a dead server unless it is still backing off after a failed start"""
+        if time.monotonic() < server.retry_at:
+            return False
+        try:
+            server.restart()
+        except (OSError, FestivalError) as e:
+            self._fail(server)
+            print(f"Failed to restart festival server on port {server.port}, next try in {server.backoff:.0f} s: {e}", file=sys.stderr)
+            return False
+        server.backoff = 0.0
+        return True
+
+    def _checkout(self) -> FestivalServer:
+        server = self._idle.get()
+        skipped = []
+        try:
+            while not (server.sock or self._revive(server)):
+                skipped.append(server)
+                server = self._idle.get_nowait()
+        except queue.Empty:
+            raise FestivalError("no festival server running")
+        finally:
+            for dead in skipped:
+                self._idle.put(dead)
+        return server
+
+    def synthesize(self, text: str, voice_cmd: str) -> bytes:
+        self._ready.wait()
+        server = self._checkout()
+        try:
+            try:
+                return server.synthesize(text, voice_cmd)
+            except (OSError, FestivalError):
+                # Crashed or desynchronized server, start a fresh one and retry once
+                if not self._revive(server):
+                    raise FestivalError(f"festival server on port {server.port} could not be restarted")
+                return server.synthesize(text, voice_cmd)
+        finally:
+            self._idle.put(server)
+
+    def shutdown(self):
+        for server in self.servers:
+            server.stop()
+
+def create_festival_pool():
+    if os.environ.get('RASPITRON_FESTIVAL_MODE', 'server') != 'server':
+        return None
+    try:
+        size = int(os.environ.get('RASPITRON_FESTIVAL_SERVERS', '1'))
+        base_port = int(os.environ.get('RASPITRON_FESTIVAL_PORT', '1314'))
+    except ValueError:
+        size, base_port = 1, 1314
+    voices = os.environ.get('RASPITRON_FESTIVAL_VOICES', 'machac,dita').split(',')
+    return FestivalServerPool(size, base_port, [v.strip() for v in voices if v.strip()])
+
+def benchmark(texts, voice: str, runs: int):
+    voice_cmd = get_voice_cmd(voice)
+    pool = FestivalServerPool(1, preload_voices=(voice,))
+    if not pool.wait_ready():
+        print("festival server did not start", file=sys.stderr)
+        return
+
+    results = {}
+    for name, fn in (('text2wave', lambda t: text2wave(t, voice_cmd)),
+                     ('server', lambda t: pool.synthesize(t, voice_cmd))):
+        timings = []
+        for _ in range(runs):
+            for text in texts:
+                t0 = time.perf_counter()
+                fn(text)
+                timings.append(time.perf_counter() - t0)
+        timings.sort()
+        results[name] = timings
+        print(f"{name:10s} mean {1000 * sum(timings) / len(timings):7.1f} ms  "
+              f"median {1000 * timings[len(timings) // 2]:7.1f} ms  max {1000 * timings[-1]:7.1f} ms")
+    pool.shutdown()
+
+    speedup = (sum(results['text2wave']) / sum(results['server']))
+    print(f"server mode is {speedup:.1f}x faster per utterance")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='Benchmark festival server mode against text2wave per call')
+    parser.add_argument('--voice', default='dita')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('texts', nargs='*', default=['ahoj', 'jak se máš', 'dneska je pěkně a jdeme na pivo'])
+    args = parser.parse_args()
+    benchmark(args.texts, args.voice, args.runs)
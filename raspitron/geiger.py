@@ -1,6 +1,10 @@
+import asyncio
 from sounds import sounds
 
-def run(stop_event):
+async def run():
+    """Tick until the task is cancelled"""
     sounds.start_geiger()
-    stop_event.wait()
-    sounds.stop_geiger()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        sounds.stop_geiger()
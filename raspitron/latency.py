@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+
+try:
+    import alsaaudio
+except ModuleNotFoundError:
+    alsaaudio = None
+import numpy as np
+
+from audio import AUDIO_PROFILES, resample_wav, resampled_path
+
+EFFECTS = ['keypress.wav', 'boop.wav', 'beep.wav', 'beep-startup.wav', 'geiger.wav', 'reload.wav']
+
+# alsa-lib prints this when SDL recovers from an xrun on the playback device
+UNDERRUN_RE = re.compile(r'underrun occurred')
+
+class OnsetCapture:
+    """Records the output through a loopback cable or microphone to find when each click became audible"""
+    def __init__(self, device: str, rate: int, threshold: int, periodsize: int = 64):
+        if alsaaudio is None:
+            raise RuntimeError("pyalsaaudio is not installed, capture is not available")
+        self.rate = rate
+        self.threshold = threshold
+        self.pcm = alsaaudio.PCM(alsaaudio.PCM_CAPTURE, device=device)
+        self.pcm.setchannels(1)
+        self.pcm.setrate(rate)
+        self.pcm.setformat(alsaaudio.PCM_FORMAT_S16_LE)
+        self.pcm.setperiodsize(periodsize)
+        self.chunks = []
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            frames, data = self.pcm.read()
+            if frames > 0:
+                self.chunks.append((time.perf_counter(), frames, data))
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.pcm.close()
+
+    def onset_after(self, t0: float, window: float = 0.5):
+        """Seconds from t0 to the first sample above the threshold, None when nothing was heard"""
+        for read_at, frames, data in self.chunks:
+            if read_at < t0:
+                continue
+            samples = np.abs(np.frombuffer(data, dtype='<i2')[:frames].astype(np.int32))
+            for idx in np.flatnonzero(samples >= self.threshold):
+                onset = read_at - (frames - idx) / self.rate - t0
+                if onset > window:
+                    return None
+                if onset >= 0:
+                    return onset
+        return None
+
+def measure(args) -> dict:
+    """Runs inside a child process so every profile gets a freshly initialized mixer"""
+    from audio import audio
+    click = audio.load('keypress.wav')
+    capture = None
+    if args.capture:
+        capture = OnsetCapture(args.capture, audio.rate, args.threshold)
+    else:
+        # Keep the mixer busy like the geiger counter does while waiting for a reply
+        audio.play('geiger', audio.load('geiger.wav'), loops=-1)
+
+    pressed = []
+    for _ in range(args.clicks):
+        time.sleep(random.uniform(0.08, 0.2))
+        t0 = time.perf_counter()
+        audio.play('keypress', click, requested_at=t0)
+        pressed.append(t0)
+    time.sleep(0.5)
+    audio.stop()
+
+    result = {'profile': audio.profile['name'], 'rate': audio.rate, 'buffer': audio.buffer}
+    result.update(audio.latency_stats())
+    if capture:
+        capture.stop()
+        onsets = sorted(o for o in (capture.onset_after(t0) for t0 in pressed) if o is not None)
+        result['heard'] = len(onsets)
+        if onsets:
+            result['onset_mean_ms'] = 1000 * sum(onsets) / len(onsets)
+            result['onset_p95_ms'] = 1000 * onsets[int(0.95 * (len(onsets) - 1))]
+    return result
+
+def run_profile(profile: str, args) -> dict:
+    env = dict(os.environ, RASPITRON_AUDIO_PROFILE=profile)
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', '--clicks', str(args.clicks),
+           '--threshold', str(args.threshold)]
+    if args.capture:
+        cmd += ['--capture', args.capture]
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"profile {profile} failed: {proc.stderr.strip()}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['underruns'] = len(UNDERRUN_RE.findall(proc.stderr))
+    return result
+
+def resample_effects(rate: int):
+    for name in EFFECTS:
+        if os.path.exists(name):
+            resample_wav(name, resampled_path(name, rate), rate)
+            print(f"{resampled_path(name, rate)}", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure keypress-to-audio-start latency and underruns per audio profile')
+    parser.add_argument('--profiles', default=','.join(AUDIO_PROFILES), help='comma separated names from AUDIO_PROFILES')
+    parser.add_argument('--clicks', type=int, default=50)
+    parser.add_argument('--capture', help='ALSA capture device wired to the output (loopback or microphone) to measure real onset')
+    parser.add_argument('--threshold', type=int, default=2000, help='capture amplitude that counts as the click being audible')
+    parser.add_argument('--resample', type=int, metavar='RATE', help='only write the effects resampled to RATE into assets/RATE/')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.child:
+        print(json.dumps(measure(args)))
+        return
+    if args.resample:
+        resample_effects(args.resample)
+        return
+
+    print(f"{'profile':<12} {'rate':>6} {'buffer':>6} {'dispatch+buf':>13} {'p95':>8} {'onset':>8} {'underruns':>9}")
+    for profile in args.profiles.split(','):
+        st = run_profile(profile, args)
+        onset = f"{st['onset_mean_ms']:.1f}" if 'onset_mean_ms' in st else '-'
+        print(f"{st['profile']:<12} {st['rate']:>6} {st['buffer']:>6} {st.get('mean_ms', 0):>10.1f} ms "
+              f"{st.get('p95_ms', 0):>5.1f} ms {onset:>8} {st['underruns']:>9}")
+
+if __name__ == "__main__":
+    main()
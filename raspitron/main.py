@@ -3,28 +3,36 @@
 from dotenv import load_dotenv
 import os
 import sys
-import requests
 import time
+import asyncio
+from prompt_toolkit.patch_stdout import patch_stdout
 from prompt import Session
 from sounds import sounds
-from tts import create_tts_manager
+from audio import audio
+from tts import create_tts_manager, AudioBuffer
+from transport import create_transport
+from assets import AssetManifest
 try:
     from player import BeePlayer
 except ModuleNotFoundError:
     BeePlayer = None
 from math import pi
-import threading
 if os.environ.get('DISABLE_GEIGER', '0') != "1":
     import geiger
 else:
     import types
     geiger = types.ModuleType("geiger")
-    def run(stop_event):
-        stop_event.wait()
+    async def run():
+        await asyncio.Event().wait()
     geiger.run = run
 
 load_dotenv()
 
+# Doppler sweep played after every reply, pre-render with:
+#   python assets.py --param d=5 --param v=177.77777777777777 --param omega=1382.300767579509
+BEEP_PARAMS = {'d': 5, 'v': 640/3.6, 'omega': 2*pi*220}
+BEEP_SPAN = (-0.02, 0.02)
+
 class RaspiTRON:
     def __init__(self):
         self.storytron_url = os.environ.get('STORYTRON_URL', 'https://pomotron.cz')
@@ -39,81 +47,139 @@ class RaspiTRON:
         self.pomo_tts_engine = os.environ.get('POMO_TTS_ENGINE', 'festival')
         self.pomo_tts_voice = os.environ.get('POMO_TTS_VOICE', "dita")
         self.disable_sentence_echo = (os.environ.get("DISABLE_SENTENCE_ECHO", "1") == "1")
+        # Ask StoryTRON to synthesize replies so the Pi only downloads and plays them
+        self.server_tts = os.environ.get('RASPITRON_SERVER_TTS', '1') == '1'
+        # Send the chat request while Pomo's echo is still playing
+        self.overlap_echo = os.environ.get('RASPITRON_OVERLAP_ECHO', '1') == '1'
+        # Key that interrupts the current speech: any, a dedicated key such as f9, or off
+        self.barge_in_key = os.environ.get('RASPITRON_BARGE_IN', 'any')
+
+        self.transport = create_transport(self.storytron_url, self.request_timeout)
+        self._beep_sound = None
+        self._tasks = set()
+
+    async def fetch_audio(self, audio_url: str):
+        return await self.transport.get(audio_url)
+
+    async def request_reply(self, message: str):
+        """Chat round trip plus reply audio preparation, returns (data, audio buffer)"""
+        started = time.perf_counter()
+        data = await self.transport.chat(message, tts=self.server_tts)
+        if not data:
+            return None, None
+        print(f"[Request: {1000 * (time.perf_counter() - started):.0f} ms]", file=sys.stderr, end="\r\n")
 
-    def send_message(self, message: str):
-        victory = False
+        audio_buffer = None
+        if data.get('audio_url'):
+            audio_data = await self.fetch_audio(data['audio_url'])
+            if audio_data:
+                audio_buffer = AudioBuffer(audio_data, 'wav')
+        if audio_buffer is None:
+            audio_buffer = await self.tts.prefetch_async(data.get('agent_response', ''), agent=data.get('active_agent', 'bot'),
+                                                         engine_type=data.get('tts_engine', 'gtts'), voice=data.get('tts_voice'))
+        return data, audio_buffer
+
+    async def send_message(self, message: str, pending=None, turn_started=None):
         print("\r")
         print(f"[Sending: {message}]", file=sys.stderr, end="\r\n")
-        stop_event = threading.Event()
-        geiger_thread = threading.Thread(target=geiger.run, args=(stop_event,))
-        geiger_thread.start()
-        def stop_geiger(success=True):
-            stop_event.set()
-            geiger_thread.join()
-            if success:
-                self.beep()
-        data = None
+        loop = asyncio.get_running_loop()
+        geiger_task = asyncio.create_task(geiger.run())
+        def stop_geiger():
+            # Called on the TTS worker right before the reply starts playing
+            loop.call_soon_threadsafe(geiger_task.cancel)
+            sounds.stop_geiger()
+            self.beep()
+            if turn_started is not None:
+                print(f"[Turn latency: {1000 * (time.perf_counter() - turn_started):.0f} ms]", file=sys.stderr, end="\r\n")
+
         try:
-            response = requests.post(
-                f"{self.storytron_url}/api/chat",
-                json={"message": message},
-                # Separate connect and read timeouts: (connect, read)
-                timeout=(5, self.request_timeout)
-            )
-            if response.status_code == 200:
-                data = response.json()
-            else:
-                error = f"Server error: {response.status_code}"
-                print(f"{error}", end="\r\n")
-        except requests.exceptions.RequestException as e:
-            error = f"Connection error: {e}"
-            print(f"{error}", end="\r\n")
+            data, audio_buffer = await (pending or self.request_reply(message))
+            if not data:
+                return
 
-        if data:
             bot_response = data.get('agent_response', 'No response')
             agent = data.get('active_agent', 'bot')
             tts_engine = data.get('tts_engine', 'gtts')
             tts_voice = data.get('tts_voice', None)
-            victory = data.get('victory', False)
             print(f"{agent}: {bot_response}", end="\r\n")
             sounds.play_boop()
-            self.tts.say(bot_response, agent=agent, cb=stop_geiger, engine_type=tts_engine, voice=tts_voice)
-        else:
-            stop_geiger(success=False)
+            # Wait for the tts to say what it wants to say
+            await asyncio.wrap_future(self.tts.say(bot_response, agent=agent, cb=stop_geiger, engine_type=tts_engine,
+                                                   voice=tts_voice, audio_data=audio_buffer))
+            if data.get('victory', False):
+                sounds.play_music()
+        finally:
+            geiger_task.cancel()
 
-        # Wait for the tts to say what it wants to say
-        self.tts.join()
-        if victory:
-            sounds.play_music()
+    async def turn(self, line: str, previous=None):
+        """One message round, turns run in order while the prompt keeps taking input"""
+        if previous:
+            await asyncio.wait([previous])
+        turn_started = time.perf_counter()
+        pending = asyncio.create_task(self.request_reply(line)) if self.overlap_echo else None
+        try:
+            echo = self.tts.say(line, agent="pomo", engine_type=self.pomo_tts_engine, voice=self.pomo_tts_voice,
+                                priority='echo')
+            sounds.play_beep()
+            await asyncio.wrap_future(echo)
+            await self.send_message(line, pending, turn_started)
+        except Exception as e:
+            print(f"[Turn failed: {e}]", file=sys.stderr, end="\r\n")
+        finally:
+            if pending:
+                pending.cancel()
 
 
+    def beep_sound(self):
+        if self._beep_sound is None:
+            path = AssetManifest().find('player:BeePlayer', BEEP_PARAMS, *BEEP_SPAN)
+            if path:
+                self._beep_sound = audio.load(path)
+            else:
+                player = BeePlayer(**BEEP_PARAMS)
+                self._beep_sound = audio.pcm_sound(player.render(*BEEP_SPAN), player.rate, channels=2)
+        return self._beep_sound
+
     def beep(self):
         if not BeePlayer:
             return
-        player = BeePlayer(d=5, v=640/3.6, omega=2*pi*220)
-        player.open()
-        player.play(-0.02, 0.02)
-        player.close()
+        requested_at = time.perf_counter()
+        audio.play('doppler', self.beep_sound(), requested_at=requested_at)
+        audio.wait('doppler')
 
-    def run(self):
+    async def run_async(self):
         self.tts = create_tts_manager()
-        self.session = Session()
+        self.session = Session(on_barge_in=self.tts.cancel, barge_in_key=self.barge_in_key)
+        prewarm = asyncio.create_task(self.transport.prewarm())
+        self._tasks.add(prewarm)
+        prewarm.add_done_callback(self._tasks.discard)
+        if BeePlayer:
+            self.beep_sound()
         sounds.play_beep_startup()
+        last_turn = None
         try:
-            while True:
-                line = self.session.prompt().strip()
-                if not line:
-                    continue
-
-                self.tts.say(line, agent="pomo", engine_type=self.pomo_tts_engine, voice=self.pomo_tts_voice)
-                sounds.play_beep()
-                self.tts.join()
-                self.send_message(line)
+            with patch_stdout(raw=True):
+                while True:
+                    line = (await self.session.prompt_async()).strip()
+                    if not line:
+                        continue
+                    last_turn = asyncio.create_task(self.turn(line, last_turn))
+                    self._tasks.add(last_turn)
+                    last_turn.add_done_callback(self._tasks.discard)
         except EOFError:
             sounds.play_reload()
-            time.sleep(0.5)
+            await asyncio.sleep(0.5)
         finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
             self.tts.shutdown()
+            await self.transport.aclose()
+            audio.print_stats()
+            self.transport.print_stats()
+
+    def run(self):
+        asyncio.run(self.run_async())
 
 def main():
     app = RaspiTRON()
@@ -1,9 +1,38 @@
 #!/usr/bin/env python3
 
-import alsaaudio
-from math import sin, pi, sqrt
+try:
+    import alsaaudio
+except ModuleNotFoundError:
+    alsaaudio = None
+from math import sin, pi, sqrt, floor
+import wave
+import numpy as np
+
+class BufferDevice:
+    """Collects periods in memory instead of writing them to ALSA"""
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, buf):
+        self.data += buf
+
+    def close(self):
+        pass
+
+def _quantize(y):
+    return np.clip(np.trunc(32768*y), -32768, 32767).astype(np.int32)
+
+def _first_crossing(seg):
+    """Index of the first zero or sign change, same rule as the per-sample pre/post period loops"""
+    prev = np.concatenate(([0], seg[:-1]))
+    hit = (seg == 0) | ((prev != 0) & ((prev ^ seg) < 0))
+    idx = np.flatnonzero(hit)
+    return idx[0] if idx.size else len(seg)
 
 class Player:
+    # Rendered PCM keyed by cache_key() + (start, stop)
+    _render_cache = {}
+
     def __init__(self, periodsize=4096, rate=44100):
         self.periodsize = periodsize
         self.rate = rate
@@ -20,22 +49,37 @@ class Player:
     def fr(self, t):
         return self.f(t)
 
-    def export(self, start, stop, filename):
-        i = 0
-        t = start
-        dt = self.dt
-        fl = self.fl
-        fr = self.fr
-        with open(filename, "wb") as f:
-            while (t <= stop):
-                val = min(32767, int(32768*fl(t)))
-                f.write(bytes([val & 255, val >> 8 & 255]))
-                val = min(32767, int(32768*fr(t)))
-                f.write(bytes([val & 255, val >> 8 & 255]))
-                t = start + i*dt
-                i += 1
+    # Vectorized counterparts of f/fl/fr operating on numpy arrays of times
+    def f_vec(self, t):
+        return np.sin(2*pi*440*t)
+
+    def fl_vec(self, t):
+        return self.f_vec(t)
+
+    def fr_vec(self, t):
+        return self.f_vec(t)
+
+    def cache_key(self):
+        """Hashable description of the waveform, None disables render caching"""
+        return None
+
+    def export(self, start, stop, filename, chunk_frames=65536):
+        """Write the untrimmed signal from start to stop as a stereo S16_LE WAV file"""
+        frames = int(floor((stop - start)/self.dt)) + 1
+        with wave.open(filename, "wb") as wf:
+            wf.setnchannels(2)
+            wf.setsampwidth(2)
+            wf.setframerate(self.rate)
+            for i in range(0, frames, chunk_frames):
+                t = start + np.arange(i, min(frames, i + chunk_frames))*self.dt
+                out = np.empty((len(t), 2), dtype='<i2')
+                out[:, 0] = _quantize(self.fl_vec(t))
+                out[:, 1] = _quantize(self.fr_vec(t))
+                wf.writeframes(out.tobytes())
 
     def open(self):
+        if alsaaudio is None:
+            raise RuntimeError("pyalsaaudio is not installed, use render() instead")
         self.dev = alsaaudio.PCM()
         self.dev.setchannels(2)
         self.dev.setrate(self.rate)
@@ -145,6 +189,42 @@ class Player:
             self.playperiod()
         self.playpostperiod()
 
+    def render(self, start, stop) -> bytes:
+        """Render interleaved S16_LE stereo PCM for playback through the audio engine"""
+        key = self.cache_key()
+        if key is not None:
+            key += (start, stop)
+            pcm = Player._render_cache.get(key)
+            if pcm is not None:
+                return pcm
+
+        pcm = self._render_vec(start, stop)
+        if key is not None:
+            Player._render_cache[key] = pcm
+        return pcm
+
+    def _render_vec(self, start, stop) -> bytes:
+        """Same periods as play(): one pre period, full periods until stop, one post period"""
+        n = self.periodsize
+        periods = 1
+        while start + periods*n*self.dt < stop:
+            periods += 1
+        t = start + np.arange((periods + 1)*n)*self.dt
+        out = np.empty((len(t), 2), dtype='<i2')
+        for ch, fn in enumerate((self.fl_vec, self.fr_vec)):
+            val = _quantize(fn(t))
+            val[:_first_crossing(val[:n])] = 0
+            post = val[-n:]
+            post[_first_crossing(post):] = 0
+            out[:, ch] = val
+        return out.tobytes()
+
+    def render_loop(self, start, stop) -> bytes:
+        """Per-sample reference renderer driven through play()"""
+        self.dev = BufferDevice()
+        self.play(start, stop)
+        return bytes(self.dev.data)
+
     def close(self):
         self.dev.close()
 
@@ -162,6 +242,18 @@ class BeePlayer(Player):
     def f0(self, t):
         return sin(self.omega*t)
 
+    def f0_vec(self, t):
+        return np.sin(self.omega*t)
+
+    def f_vec(self, t):
+        w = self.w
+        b = np.sqrt(t**2*w + self.alpha)
+        delta = self.delta
+        return delta*((b+t*w) / (t**2*w+delta**2)) * self.f0_vec((t-b)/(1-w))
+
+    def cache_key(self):
+        return (type(self), self.c, self.v, self.d, self.omega, self.rate, self.periodsize)
+
     def f(self, t):
         w = self.w
         b = sqrt(t**2*w + self.alpha)
@@ -17,63 +17,74 @@ def erring_handler(fn):
     return wrapped
 
 class Session:
-    def __init__(self):
+    def __init__(self, on_barge_in=None, barge_in_key='any'):
+        self.on_barge_in = on_barge_in if barge_in_key != 'off' else None
+        self.barge_in_any = barge_in_key == 'any'
         kb = KeyBindings()
 
+        if self.on_barge_in and not self.barge_in_any:
+            @kb.add(barge_in_key)
+            @erring_handler
+            def handle_barge_in(event):
+                self.on_barge_in()
+
         # Override default key bindings to add sound
         @kb.add('<any>')
         @erring_handler
         def handle_any(event):
-            sounds.play_keypress()
+            self.play_keypress()
+            # Only typing interrupts speech, moving the cursor or deleting does not
+            if self.barge_in_any and self.on_barge_in:
+                self.on_barge_in()
             # Insert the character manually
             event.app.current_buffer.insert_text(event.data)
 
         @kb.add('left')
         @erring_handler
         def handle_left(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.cursor_left()
 
         @kb.add('right')
         @erring_handler
         def handle_right(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.cursor_right()
 
         @kb.add('up')
         @erring_handler
         def handle_up(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.history_backward()
 
         @kb.add('down')
         @erring_handler
         def handle_down(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.history_forward()
 
         @kb.add('backspace')
         @erring_handler
         def handle_backspace(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.delete_before_cursor()
 
         @kb.add('delete')
         @erring_handler
         def handle_delete(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.delete()
 
         @kb.add('home')
         @erring_handler
         def handle_home(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.cursor_position = 0
 
         @kb.add('end')
         @erring_handler
         def handle_end(event):
-            sounds.play_keypress()
+            self.play_keypress()
             event.app.current_buffer.cursor_position = len(event.app.current_buffer.text)
 
         @kb.add('f10')
@@ -93,3 +104,11 @@ class Session:
             raise e.error
         except KeyboardInterrupt:
             return ""
+
+    async def prompt_async(self):
+        try:
+            return await self.prompt_session.prompt_async("pomo> ")
+        except HandlerError as e:
+            raise e.error
+        except KeyboardInterrupt:
+            return ""
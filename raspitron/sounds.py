@@ -2,6 +2,9 @@ import pygame
 import sys
 import glob
 import os
+import time
+import resource
+from audio import audio
 
 class Sounds:
     _instance = None
@@ -17,20 +20,8 @@ class Sounds:
             return
         self._initialized = True
 
-        if not pygame.mixer.get_init():
-            pygame.mixer.init()
-
-        # Reserve channels for each sound type
-        pygame.mixer.set_num_channels(8)  # Ensure we have enough channels
-        self.channels = {
-            'keypress': pygame.mixer.Channel(0),
-            'boop': pygame.mixer.Channel(1),
-            'beep': pygame.mixer.Channel(2),
-            'beep-startup': pygame.mixer.Channel(3),
-            'geiger': pygame.mixer.Channel(4),
-            'music': pygame.mixer.Channel(5),
-            'reload': pygame.mixer.Channel(6)
-        }
+        # Channels are reserved per sound type by the shared audio engine
+        self.channels = audio.channels
 
         self.sounds = {}
         self._geiger_paused = False
@@ -40,18 +31,17 @@ class Sounds:
     def _load_sounds(self):
         sound_files = ['keypress.wav', 'boop.wav', 'beep.wav', 'beep-startup.wav', 'geiger.wav', 'reload.wav']
 
-        # Add first MP3 file from ~/Music if available
+        # First MP3 file from ~/Music is streamed on victory, not decoded at startup
         music_files = glob.glob(os.path.expanduser('~/Music/*.mp3'))
         if music_files:
             self._music_file = music_files[0]
-            sound_files.append(self._music_file)
         else:
             print("Warning: No MP3 files found in ~/Music", file=sys.stderr)
             self._music_file = None
 
         for filename in sound_files:
             try:
-                self.sounds[filename] = pygame.mixer.Sound(filename)
+                self.sounds[filename] = audio.load(filename)
             except (pygame.error, FileNotFoundError) as e:
                 print(f"Warning: Could not load {filename}: {e}", file=sys.stderr)
                 self.sounds[filename] = None
@@ -83,9 +73,10 @@ class Sounds:
 
     def play_music(self):
         if self._music_file:
-            sound = self.sounds.get(self._music_file)
-            if sound:
-                self.channels['music'].play(sound)
+            try:
+                audio.play_stream(self._music_file)
+            except pygame.error as e:
+                print(f"Warning: Could not play {self._music_file}: {e}", file=sys.stderr)
 
     def start_geiger(self):
         """Start geiger counter sound (resumes if paused, starts fresh if stopped)"""
@@ -114,5 +105,30 @@ class Sounds:
     def is_geiger_playing(self):
         return self.channels['geiger'].get_busy()
 
+def compare_music_loading(path: str):
+    """Startup cost of decoding the track with mixer.Sound versus opening the stream"""
+    def rss_mb():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    t0 = time.perf_counter()
+    audio.play_stream(path)
+    audio.stop_stream()
+    stream_s = time.perf_counter() - t0
+
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    sound = pygame.mixer.Sound(path)
+    decode_s = time.perf_counter() - t0
+    decoded_mb = len(sound.get_raw()) / 1e6
+
+    print(f"stream open:   {1000 * stream_s:8.1f} ms")
+    print(f"full decode:   {1000 * decode_s:8.1f} ms, {decoded_mb:.1f} MB PCM, peak RSS +{rss_mb() - rss_before:.1f} MB")
+
 # Global sounds instance
 sounds = Sounds()
+
+if __name__ == "__main__":
+    music = sys.argv[1] if len(sys.argv) > 1 else sounds._music_file
+    if not music:
+        sys.exit("usage: python sounds.py [track.mp3]")
+    compare_music_loading(music)
@@ -0,0 +1,70 @@
+import pytest
+
+from festival import FestivalError, FestivalServer, FestivalServerPool
+
+
+class FakeFestival:
+    """Stands in for the festival binary, start() fails while down is set"""
+    def __init__(self, monkeypatch):
+        self.down = False
+        self.starts = 0
+        monkeypatch.setattr(FestivalServer, 'start', lambda server: self.start(server))
+        monkeypatch.setattr(FestivalServer, 'stop', lambda server: setattr(server, 'sock', None))
+        monkeypatch.setattr(FestivalServer, 'synthesize', lambda server, text, voice_cmd: self.synthesize(server, text, voice_cmd))
+
+    def start(self, server):
+        self.starts += 1
+        if self.down:
+            raise FestivalError('festival missing')
+        server.sock = object()
+
+    def synthesize(self, server, text, voice_cmd):
+        if server.sock is None:
+            raise FestivalError('not running')
+        return text.encode()
+
+
+def test_dead_server_is_restarted_after_backoff(monkeypatch):
+    fake = FakeFestival(monkeypatch)
+    fake.down = True
+    pool = FestivalServerPool(1)
+    assert not pool.wait_ready(5)
+    with pytest.raises(FestivalError):
+        pool.synthesize('ahoj', 'voice')
+    # Still backing off, no new start
+    assert fake.starts == 1
+    fake.down = False
+    pool.servers[0].retry_at = 0.0
+    assert pool.synthesize('ahoj', 'voice') == b'ahoj'
+    assert pool.available and pool.servers[0].backoff == 0.0
+
+
+def test_failed_restart_backs_off_and_keeps_the_server(monkeypatch):
+    fake = FakeFestival(monkeypatch)
+    pool = FestivalServerPool(1)
+    assert pool.wait_ready(5)
+    pool.servers[0].sock = None
+    fake.down = True
+    with pytest.raises(FestivalError):
+        pool.synthesize('ahoj', 'voice')
+    first = pool.servers[0].backoff
+    assert first > 0
+    pool.servers[0].retry_at = 0.0
+    with pytest.raises(FestivalError):
+        pool.synthesize('ahoj', 'voice')
+    assert pool.servers[0].backoff == 2 * first
+    fake.down = False
+    pool.servers[0].retry_at = 0.0
+    assert pool.synthesize('ahoj', 'voice') == b'ahoj'
+
+
+def test_live_server_is_used_while_another_backs_off(monkeypatch):
+    fake = FakeFestival(monkeypatch)
+    pool = FestivalServerPool(2)
+    assert pool.wait_ready(5)
+    dead = pool.servers[0]
+    dead.sock = None
+    dead.retry_at = float('inf')
+    for _ in range(3):
+        assert pool.synthesize('ahoj', 'voice') == b'ahoj'
+    assert dead.sock is None
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from player import BeePlayer
+
+
+@pytest.mark.parametrize('params', [
+    {},
+    {'d': 3, 'omega': 2 * np.pi * 880},
+    {'v': 40, 'periodsize': 512},
+])
+def test_render_matches_render_loop(params):
+    player = BeePlayer(**params)
+    assert player.render(-0.02, 0.02) == player.render_loop(-0.02, 0.02)
+
+
+def test_render_is_cached():
+    player = BeePlayer(d=7)
+    assert player.render(-0.01, 0.01) is BeePlayer(d=7).render(-0.01, 0.01)
@@ -0,0 +1,54 @@
+import os
+
+from tts_cache import TtsCache
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = TtsCache(str(tmp_path), max_bytes=10)
+    cache.put('a', b'aaaa')
+    cache.put('b', b'bbbb')
+    assert cache.get('a')
+    cache.put('c', b'cccc')
+    assert cache.contains('a') and cache.contains('c')
+    assert not cache.contains('b')
+    assert not os.path.exists(cache.path('b'))
+    assert cache.stats()['bytes'] == 8
+
+
+def test_oversized_entry_is_not_stored(tmp_path):
+    cache = TtsCache(str(tmp_path), max_bytes=4)
+    assert cache.put('big', b'12345') is None
+    assert not cache.contains('big')
+
+
+def test_replacing_an_entry_keeps_the_size(tmp_path):
+    cache = TtsCache(str(tmp_path), max_bytes=10)
+    cache.put('a', b'aaaa')
+    cache.put('a', b'aaaaaa')
+    assert cache.stats() == dict(cache.stats(), entries=1, bytes=6)
+
+
+def test_restart_evicts_oldest_files_by_mtime(tmp_path):
+    cache = TtsCache(str(tmp_path), max_bytes=100)
+    for key, mtime in (('old', 1000), ('new', 3000), ('mid', 2000)):
+        cache.put(key, b'xxxx')
+        os.utime(cache.path(key), (mtime, mtime))
+    reopened = TtsCache(str(tmp_path), max_bytes=8)
+    assert not reopened.contains('old')
+    assert reopened.contains('mid') and reopened.contains('new')
+
+
+def test_missing_file_counts_as_miss(tmp_path):
+    cache = TtsCache(str(tmp_path), max_bytes=10)
+    cache.put('a', b'aaaa')
+    os.remove(cache.path('a'))
+    assert cache.get('a') is None
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['bytes'] == 0
+
+
+def test_stale_temp_files_are_removed_on_startup(tmp_path):
+    (tmp_path / 'abc.tmp').write_bytes(b'partial')
+    cache = TtsCache(str(tmp_path), max_bytes=10)
+    cache.put('a', b'aaaa')
+    assert sorted(os.listdir(tmp_path)) == ['a.audio']
@@ -0,0 +1,84 @@
+import time
+
+from tts_jobs import JobScheduler, TtsJob
+
+
+def job(text, priority='reply', **kwargs):
+    return TtsJob(text, 'bot', priority=priority, **kwargs)
+
+
+def test_replies_play_before_echo_and_ambient():
+    jobs = JobScheduler()
+    for queued in (job('ambient', 'ambient'), job('echo', 'echo'), job('reply')):
+        jobs.put(queued)
+    assert [jobs.get(0).text for _ in range(3)] == ['reply', 'echo', 'ambient']
+
+
+def test_same_priority_keeps_order():
+    jobs = JobScheduler()
+    for text in ('first', 'second', 'third'):
+        jobs.put(job(text))
+    assert [jobs.get(0).text for _ in range(3)] == ['first', 'second', 'third']
+
+
+def test_full_queue_sheds_low_priority_and_keeps_replies():
+    jobs = JobScheduler(max_depth=2)
+    ambient = job('ambient', 'ambient')
+    jobs.put(ambient)
+    jobs.put(job('reply 1'))
+    jobs.put(job('reply 2'))
+    assert ambient.done.result(0) is False
+    assert jobs.counts['ambient']['dropped'] == 1
+    # Replies are never shed, even past the depth
+    jobs.put(job('reply 3'))
+    assert len(jobs) == 3
+
+
+def test_backed_up_lines_merge():
+    jobs = JobScheduler(max_depth=2)
+    jobs.put(job('one', 'echo'))
+    merged = job('two', 'echo')
+    jobs.put(merged)
+    first = jobs.get(0)
+    assert first.text == 'one two'
+    first.resolve(True)
+    assert merged.done.result(0) is True
+
+
+def test_expired_job_is_dropped():
+    jobs = JobScheduler()
+    stale = job('stale', 'echo', deadline=time.monotonic() - 1)
+    jobs.put(stale)
+    jobs.put(job('fresh', 'ambient'))
+    assert jobs.get(0).text == 'fresh'
+    assert stale.done.result(0) is False
+
+
+def test_cancelled_job_is_not_played():
+    jobs = JobScheduler()
+    cancelled = job('cancelled')
+    jobs.put(cancelled)
+    assert cancelled.done.cancel()
+    popped = jobs.get(0)
+    # The worker skips a job whose future was cancelled while it was queued
+    assert not popped.done.set_running_or_notify_cancel()
+    popped.resolve(False)
+    jobs.task_done()
+    jobs.join()
+
+
+def test_drain_removes_queued_jobs_and_releases_join():
+    jobs = JobScheduler()
+    jobs.put(job('ambient', 'ambient'))
+    jobs.put(job('reply'))
+    drained = jobs.drain()
+    assert [queued.text for queued in drained] == ['reply', 'ambient']
+    assert len(jobs) == 0
+    jobs.join()
+    assert jobs.get(timeout=0.01) is None
+
+
+def test_close_wakes_get():
+    jobs = JobScheduler()
+    jobs.close()
+    assert jobs.get() is None
@@ -0,0 +1,254 @@
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import random
+import asyncio
+import tempfile
+import threading
+from collections import deque
+
+import httpx
+
+from tts_loop import EngineStats, TracingTransport
+
+class Outbox:
+    """Append-only on-disk queue of chat messages that could not be delivered"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def append(self, message: str, entry_id: str = None) -> dict:
+        """entry_id doubles as the Idempotency-Key when the message is replayed"""
+        entry = {'id': entry_id or uuid.uuid4().hex, 'message': message, 'queued_at': time.time()}
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return entry
+
+    def pending(self) -> list:
+        entries = []
+        with self._lock:
+            if not os.path.exists(self.path):
+                return entries
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        return entries
+
+    def remove(self, entry_id: str):
+        with self._lock:
+            if not os.path.exists(self.path):
+                return
+            lines = []
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn line never decodes, pending() already skips it
+                        continue
+                    if entry.get('id') != entry_id:
+                        lines.append(line)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            os.replace(tmp_path, self.path)
+
+class StorytronTransport:
+    """Keep-alive async HTTP client for StoryTRON with retries and an offline outbox"""
+    # Short chat messages grow when gzipped, only compress bodies above this size
+    GZIP_MIN_BYTES = 512
+    RETRY_STATUSES = (502, 503, 504)
+    # Long-poll window per request, below the read timeout and nginx's 60 s
+    POLL_WAIT = 20
+    # Budget for replaying the outbox while StoryTRON is known to be unreachable
+    OFFLINE_PROBE = 3.0
+
+    def __init__(self, base_url: str, read_timeout: float = 30.0, connect_timeout: float = 5.0,
+                 deadline: float = 45.0, outbox_path: str = None, job_deadline: float = 180.0, session: str = None):
+        self.base_url = base_url.rstrip('/')
+        self.read_timeout = read_timeout
+        self.connect_timeout = connect_timeout
+        self.deadline = deadline
+        self.job_deadline = job_deadline
+        self.outbox = Outbox(outbox_path) if outbox_path else None
+
+        self.http_stats = EngineStats()
+        transport = TracingTransport(self.http_stats, limits=httpx.Limits(max_connections=4, keepalive_expiry=120.0))
+        headers = {'Accept-Encoding': 'gzip, deflate'}
+        # Each box plays its own game on the server
+        if session:
+            headers['X-Session-Id'] = session
+        self.client = httpx.AsyncClient(base_url=self.base_url, transport=transport, headers=headers)
+
+        self.rtts = deque(maxlen=200)
+        self.retries = 0
+        self.offline = False
+        self._outbox_lock = asyncio.Lock()
+
+    async def prewarm(self):
+        """Open the TCP/TLS connection up front so the first message does not pay for it"""
+        try:
+            await self.client.post('/api/keepalive', timeout=self._timeout(self.read_timeout))
+        except httpx.HTTPError as e:
+            print(f"[Prewarm failed: {e}]", file=sys.stderr, end="\r\n")
+            return
+        await self.flush_outbox()
+
+    def _timeout(self, read: float) -> httpx.Timeout:
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    async def request(self, method: str, path: str, payload=None, deadline: float = None,
+                      idempotency_key: str = None) -> httpx.Response:
+        """Send with jittered exponential backoff until the deadline, raises the last error"""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        headers = {}
+        if idempotency_key:
+            # Every retry carries the same key so StoryTRON generates the turn only once
+            headers['Idempotency-Key'] = idempotency_key
+        body = None
+        if payload is not None:
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            if len(body) >= self.GZIP_MIN_BYTES:
+                body = gzip.compress(body)
+                headers['Content-Encoding'] = 'gzip'
+
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            try:
+                response = await self.client.request(method, path, content=body, headers=headers,
+                                                     timeout=self._timeout(max(1.0, min(self.read_timeout, remaining))))
+                self.rtts.append(response.elapsed.total_seconds())
+                if response.status_code not in self.RETRY_STATUSES:
+                    return response
+                error = httpx.HTTPStatusError(f"Server error: {response.status_code}", request=response.request, response=response)
+            except httpx.HTTPError as e:
+                error = e
+
+            backoff = min(8.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+            if time.monotonic() + backoff >= deadline_at:
+                raise error
+            attempt += 1
+            self.retries += 1
+            print(f"[Retry {attempt} in {backoff:.1f}s: {error}]", file=sys.stderr, end="\r\n")
+            await asyncio.sleep(backoff)
+
+    async def run_chat(self, payload: dict, key: str, deadline: float = None) -> httpx.Response:
+        """Submit a chat job and long-poll it, so no single request has to outlast the generation"""
+        try:
+            response = await self.request('POST', '/api/chat/jobs', payload, deadline=deadline, idempotency_key=key)
+        except httpx.HTTPError:
+            self.offline = True
+            raise
+        self.offline = False
+        if response.status_code != 202:
+            return response
+        poll_url = response.json()['poll_url']
+        give_up_at = time.monotonic() + self.job_deadline
+        while True:
+            response = await self.request('GET', f"{poll_url}?wait={self.POLL_WAIT}")
+            if response.status_code != 202 or time.monotonic() >= give_up_at:
+                return response
+
+    async def chat(self, message: str, tts: bool = False):
+        """Deliver the outbox and then the message, queueing it when StoryTRON is unreachable"""
+        key = uuid.uuid4().hex
+        # Offline, only probe briefly before queueing instead of retrying the outbox for the whole deadline
+        if not await self.flush_outbox(self.OFFLINE_PROBE if self.offline else None):
+            # Keep the order, the new message waits behind the undelivered ones
+            self.outbox.append(message, key)
+            print("Connection error: StoryTRON unreachable, message saved to outbox", end="\r\n")
+            return None
+        try:
+            response = await self.run_chat({"message": message, "tts": tts}, key)
+        except httpx.HTTPError as e:
+            print(f"Connection error: {e}", end="\r\n")
+            if self.outbox:
+                self.outbox.append(message, key)
+                print("[Message saved to outbox, it will be resent when the connection returns]", file=sys.stderr, end="\r\n")
+            return None
+        if response.status_code == 202:
+            print("Server error: reply is taking too long", end="\r\n")
+            if self.outbox:
+                # Replayed under the same key, the server hands back the job that is still running
+                self.outbox.append(message, key)
+                print("[Message saved to outbox, its reply will be fetched later]", file=sys.stderr, end="\r\n")
+            return None
+        if response.status_code != 200:
+            print(f"Server error: {response.status_code}", end="\r\n")
+            return None
+        return response.json()['result']
+
+    async def flush_outbox(self, deadline: float = None) -> bool:
+        """Replay queued messages in order, returns False when some are still undelivered"""
+        if not self.outbox:
+            return True
+        async with self._outbox_lock:
+            for entry in self.outbox.pending():
+                try:
+                    response = await self.run_chat({"message": entry['message'], "sender": "pomo-outbox"}, entry['id'],
+                                                   deadline)
+                except httpx.HTTPError:
+                    return False
+                if response.status_code >= 500 or response.status_code == 202:
+                    return False
+                self.outbox.remove(entry['id'])
+                if response.status_code != 200:
+                    print(f"[Dropped from outbox: {entry['message']} ({response.status_code})]", file=sys.stderr, end="\r\n")
+                    continue
+                data = response.json()['result']
+                print(f"[Replayed: {entry['message']}] {data.get('active_agent', 'bot')}: {data.get('agent_response', '')}", end="\r\n")
+        return True
+
+    async def get(self, path: str):
+        try:
+            response = await self.request('GET', path)
+        except httpx.HTTPError as e:
+            print(f"Download error: {e}", file=sys.stderr, end="\r\n")
+            return None
+        if response.status_code != 200:
+            print(f"Download error: {response.status_code}", file=sys.stderr, end="\r\n")
+            return None
+        return response.content
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def stats(self) -> dict:
+        rtts = sorted(self.rtts)
+        return {
+            'requests': self.http_stats.requests,
+            'connections': self.http_stats.new_connections,
+            'retries': self.retries,
+            'rtt_mean_ms': 1000 * sum(rtts) / len(rtts) if rtts else None,
+            'rtt_p95_ms': 1000 * rtts[int(0.95 * (len(rtts) - 1))] if rtts else None,
+        }
+
+    def print_stats(self):
+        st = self.stats()
+        if st['rtt_mean_ms'] is not None:
+            print(f"[HTTP: {st['requests']} requests over {st['connections']} connections, {st['retries']} retries, "
+                  f"RTT mean {st['rtt_mean_ms']:.0f} ms, p95 {st['rtt_p95_ms']:.0f} ms]", file=sys.stderr)
+
+def create_transport(base_url: str, read_timeout: float) -> StorytronTransport:
+    try:
+        deadline = float(os.environ.get('STORYTRON_DEADLINE', '45'))
+    except ValueError:
+        deadline = 45.0
+    try:
+        job_deadline = float(os.environ.get('STORYTRON_JOB_DEADLINE', '180'))
+    except ValueError:
+        job_deadline = 180.0
+    outbox_path = os.environ.get('RASPITRON_OUTBOX', os.path.expanduser('~/.cache/raspitron/outbox.jsonl'))
+    return StorytronTransport(base_url, read_timeout=read_timeout, deadline=deadline, outbox_path=outbox_path or None,
+                              job_deadline=job_deadline, session=os.environ.get('RASPITRON_SESSION') or None)
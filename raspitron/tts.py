@@ -1,62 +1,129 @@
 #!/usr/bin/env python3
 
+import io
 import os
 import sys
 import threading
-import queue
-import tempfile
-import subprocess
 import wave
 import asyncio
 import string
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
 
 from gtts import gTTS
 from google import genai
 from google.genai import types
-from openai import AsyncOpenAI
-from openai.helpers import LocalAudioPlayer
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from audio import audio
+from festival import FestivalError, create_festival_pool, get_voice_cmd, text2wave
+from tts_cache import create_tts_cache
+from tts_loop import AsyncLoop, EngineStats, TracingTransport, print_engine_stats
+from tts_jobs import DEFAULT_MAX_WAIT, PRIORITIES, JobScheduler, TtsJob
+
+class AudioBuffer:
+    """Synthesized audio kept in memory, either encoded (wav, mp3) or raw S16_LE PCM"""
+    def __init__(self, data: bytes, fmt: str, rate: int = None, channels: int = 1, sample_width: int = 2, cacheable: bool = True):
+        self.data = data
+        self.fmt = fmt
+        self.rate = rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.cacheable = cacheable
+
+    def encoded(self) -> bytes:
+        """Self-describing audio bytes, PCM gets a WAV header"""
+        if self.fmt != 'pcm':
+            return self.data
+        buf = io.BytesIO()
+        with wave.open(buf, 'wb') as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(self.sample_width)
+            wf.setframerate(self.rate)
+            wf.writeframes(self.data)
+        return buf.getvalue()
+
+    def to_sound(self):
+        if self.fmt == 'pcm':
+            return audio.pcm_sound(self.data, self.rate, self.channels, self.sample_width)
+        return audio.load(self.data)
+
+    def export(self, filename: str):
+        with open(filename, 'wb') as f:
+            f.write(self.encoded())
 
 class TtsEngine:
     """Base TTS engine interface"""
+    default_voice = None
+    # Async engines run synthesize_async on the manager's event loop
+    is_async = False
+
     def __init__(self, lang: str = 'en'):
         self.lang = lang
 
-    def synthesize(self, text: str, filename: str, agent: str, voice: str = None):
-        """Synthesize text to audio file"""
+    def style_prefix(self, agent: str) -> str:
+        """Agent-specific instruction prepended to the synthesized text"""
+        return ''
+
+    def synthesize(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
+        """Synthesize text to an in-memory audio buffer"""
+        raise NotImplementedError
+
+    async def synthesize_async(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
         raise NotImplementedError
 
+    def export(self, text: str, filename: str, agent: str, voice: str = None):
+        """Optionally write the synthesized audio to a file"""
+        self.synthesize(text, agent, voice).export(filename)
+
+def _gtts_buffer(text: str, lang: str, cacheable: bool = True) -> AudioBuffer:
+    fp = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(fp)
+    return AudioBuffer(fp.getvalue(), 'mp3', cacheable=cacheable)
+
 class GttsEngine(TtsEngine):
-    def synthesize(self, text: str, filename: str, agent: str, voice: str = None):
+    def synthesize(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
         # gTTS doesn't support custom voices, ignore voice parameter
-        tts = gTTS(text=text, lang=self.lang)
-        tts.save(filename)
+        return _gtts_buffer(text, self.lang)
 
 class GeminiTtsEngine(TtsEngine):
-    def __init__(self, lang: str = 'cs', api_key: str = None):
+    default_voice = "Kore"
+    is_async = True
+
+    # UGLY HACK TO CONTROL THE PROMPTS PER AGENT
+    AGENT_STYLES = {
+        "dry_gum": "Řekni tajemně chraplavým hlasem: ",
+        "washer_woman": "Řekni svižně: ",
+        "final_boss_2": "Say in a very deep voice, extremely tense and threatening, but briskly: ",
+        "tradicni": "Say in a very relieved, surprised voice, sometimes even flirty, moderately quickly: ",
+    }
+
+    def __init__(self, loop: AsyncLoop, lang: str = 'cs', api_key: str = None):
         super().__init__(lang)
         api_key = api_key or os.environ.get('GOOGLE_API_KEY')
         if not api_key:
             raise RuntimeError("GOOGLE_API_KEY environment variable not set")
 
+        self.loop = loop
         self.client = genai.Client(api_key=api_key)
 
-    def synthesize(self, text: str, filename: str, agent: str, voice: str = None):
+    def style_prefix(self, agent: str) -> str:
+        return self.AGENT_STYLES.get(agent, '')
+
+    # Gemini returns 24 kHz mono S16_LE PCM
+    PCM_RATE = 24000
+
+    def synthesize(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
+        return self.loop.run(self.synthesize_async(text, agent, voice))
+
+    async def synthesize_async(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
         try:
-            # Use provided voice or default to "Kore"
-            voice_name = voice if voice else "Kore"
-
-            # UGLY HACK TO CONTROL THE PROMPTS PER AGENT
-            contents = text
-            if agent == "dry_gum":
-                contents = "Řekni tajemně chraplavým hlasem: " + text
-            elif agent == "washer_woman":
-                contents = "Řekni svižně: " + text
-            elif agent == "final_boss_2":
-                contents = "Say in a very deep voice, extremely tense and threatening, but briskly: " + text
-            elif agent == "tradicni":
-                contents = "Say in a very relieved, surprised voice, sometimes even flirty, moderately quickly: " + text
-
-            response = self.client.models.generate_content(
+            voice_name = voice if voice else self.default_voice
+            contents = self.style_prefix(agent) + text
+
+            response = await self.client.aio.models.generate_content(
                 model="gemini-2.5-flash-preview-tts",
                 contents=contents,
                 config=types.GenerateContentConfig(
@@ -72,96 +139,94 @@ class GeminiTtsEngine(TtsEngine):
             )
 
             audio_data = response.candidates[0].content.parts[0].inline_data.data
-            self._save_wave_file(filename, audio_data)
+            return AudioBuffer(audio_data, 'pcm', rate=self.PCM_RATE)
 
         except Exception as e:
             print(f"Gemini TTS error: {e}, falling back to gTTS", file=sys.stderr)
-            tts = gTTS(text=text, lang='cs')
-            tts.save(filename)
-
-    def _save_wave_file(self, filename: str, pcm_data: bytes, channels: int = 1, rate: int = 24000, sample_width: int = 2):
-        with wave.open(filename, "wb") as wf:
-            wf.setnchannels(channels)
-            wf.setsampwidth(sample_width)
-            wf.setframerate(rate)
-            wf.writeframes(pcm_data)
+            # Do not let the fallback audio be cached as Gemini output, gTTS blocks so keep it off the shared loop
+            return await asyncio.to_thread(_gtts_buffer, text, 'cs', False)
 
 class FestivalEngine(TtsEngine):
     """Festival TTS engine for Czech"""
+    default_voice = "machac"
+
     def __init__(self, voice: str = "machac"):
         super().__init__('cs')
         self.voice_cmd = self.get_voice_cmd(voice)
+        # Warm festival servers, falls back to text2wave per call when unavailable
+        self.pool = create_festival_pool()
 
     def get_voice_cmd(self, voice: str):
-        return {
-            "krb": "(voice_czech_krb)",
-            "dita": "(voice_czech_dita)",
-            "machac": "(voice_czech_machac)",
-            "ph": "(voice_czech_ph)",
-            "mbrola": '(progn (set! mbrola_progname "/usr/bin/mbrola")(set! czech-mbrola_database "/usr/share/mbrola/cz2/cz2")(require \'czech-mbrola)(voice_czech_mbrola_cz2))',
-        }.get(voice, "(voice_czech_krb)")
-
-    def synthesize(self, text: str, filename: str, agent: str, voice: str = None):
-        encoded_text = text.encode('iso8859-2', errors='ignore')
-        with open(filename, 'wb') as outfile:
-            # Use provided voice or default to "machac"
-            voice_name = voice if voice else "machac"
-            voice_cmd = self.get_voice_cmd(voice_name)
-            text2wave_proc = subprocess.Popen(
-                ['text2wave', '-eval', voice_cmd],
-                stdin=subprocess.PIPE,
-                stdout=outfile
-            )
-            text2wave_proc.stdin.write(encoded_text)
-            text2wave_proc.stdin.close()
-            text2wave_proc.wait()
+        return get_voice_cmd(voice)
+
+    def synthesize(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
+        voice_name = voice if voice else self.default_voice
+        voice_cmd = self.get_voice_cmd(voice_name)
+        audio_data = None
+        if self.pool:
+            try:
+                audio_data = self.pool.synthesize(text, voice_cmd)
+            except FestivalError as e:
+                print(f"Festival server error: {e}, falling back to text2wave", file=sys.stderr)
+        if not audio_data:
+            audio_data = text2wave(text, voice_cmd)
+        return AudioBuffer(audio_data, 'wav')
 
 class OpenAiTtsEngine(TtsEngine):
     """OpenAI TTS engine with real-time streaming"""
-    def __init__(self, lang: str = 'cs', api_key: str = None):
+    default_voice = "alloy"
+    # tts-1 streams 24 kHz mono S16_LE PCM, hand it out in ~0.25 s slices
+    PCM_RATE = 24000
+    STREAM_CHUNK_BYTES = 12000
+    is_async = True
+
+    def __init__(self, loop: AsyncLoop, lang: str = 'cs', api_key: str = None, stats: EngineStats = None):
         super().__init__(lang)
 
         api_key = api_key or os.environ.get('OPENAI_API_KEY')
         if not api_key:
             raise RuntimeError("OPENAI_API_KEY environment variable not set")
 
-        self.client = AsyncOpenAI(api_key=api_key, timeout=50.0)
+        self.loop = loop
+        # Keep idle connections around between replies so each one does not pay for a new TLS handshake
+        transport = TracingTransport(stats or EngineStats(), limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=120.0))
+        self.client = AsyncOpenAI(api_key=api_key, timeout=50.0, http_client=DefaultAsyncHttpxClient(transport=transport))
 
-    def synthesize(self, text: str, filename: str, agent: str, voice: str = None):
-        """Synthesize text to audio file using OpenAI TTS"""
-        # Run async synthesis in sync context
-        asyncio.run(self._async_synthesize(text, filename, agent, voice))
+    def synthesize(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
+        """Synthesize text using OpenAI TTS"""
+        return self.loop.run(self.synthesize_async(text, agent, voice))
 
-    async def _async_synthesize(self, text: str, filename: str, agent: str, voice: str = None):
+    async def synthesize_async(self, text: str, agent: str, voice: str = None) -> AudioBuffer:
         """Async synthesis method"""
-        # Use provided voice or default to "alloy"
-        voice_name = voice if voice else "alloy"
+        voice_name = voice if voice else self.default_voice
 
         response = await self.client.audio.speech.create(
             model="tts-1",
             voice=voice_name,
             input=text,
-            response_format="wav"
+            response_format="pcm"
         )
+        return AudioBuffer(response.content, 'pcm', rate=self.PCM_RATE)
 
-        # Save the audio content to file
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-
-    async def synthesize_and_play_streaming(self, text: str, agent: str, voice: str = None):
-        """Synthesize and play audio in real-time streaming mode"""
-        # Use provided voice or default to "alloy"
-        voice_name = voice if voice else "alloy"
+    async def stream(self, text: str, agent: str, voice: str = None):
+        """Yield PCM AudioBuffer chunks as they arrive"""
+        voice_name = voice if voice else self.default_voice
 
         async with self.client.audio.speech.with_streaming_response.create(
             model="tts-1",
             voice=voice_name,
             input=text,
-            response_format="pcm",  # PCM works best with LocalAudioPlayer
+            response_format="pcm",
             stream_format="audio"
         ) as response:
-            player = LocalAudioPlayer()
-            await player.play(response)
+            pending = bytearray()
+            async for chunk in response.iter_bytes():
+                pending += chunk
+                if len(pending) >= self.STREAM_CHUNK_BYTES:
+                    yield AudioBuffer(bytes(pending), 'pcm', rate=self.PCM_RATE)
+                    pending.clear()
+            if len(pending) > 1:
+                yield AudioBuffer(bytes(pending[:len(pending) - len(pending) % 2]), 'pcm', rate=self.PCM_RATE)
 
 class TtsManager:
     def __init__(self, lang: str = 'cs'):
@@ -169,23 +234,44 @@ class TtsManager:
         self.enabled = os.environ.get('RASPITRON_TTS', '1') != '0'
         self.lang = lang
         self.engines = {}
+        self.stats = {}
+        self.cache = None
+        self.loop = None
+        self._executor = None
 
         # Pre-initialize all possible engines if TTS is enabled
         if self.enabled:
+            self.loop = AsyncLoop()
+            # One long-lived thread for prefetch, nothing is spawned per reply
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts-prefetch')
             self._initialize_engines()
+            self.cache = create_tts_cache()
         else:
             print("TTS Engine disabled", file=sys.stderr)
 
-        #self._audio_player_cmd = [r"c:\\Program Files\\VideoLAN\\VLC\\vlc.exe", "--play-and-exit", "--intf", "dummy"]
-        self._audio_player_cmd = ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet']
-        self._tts_queue = queue.Queue()
+        try:
+            max_depth = int(os.environ.get('RASPITRON_TTS_QUEUE_DEPTH', '8'))
+        except ValueError:
+            max_depth = 8
+        self._jobs = JobScheduler(max_depth)
         self._tts_thread = None
 
+        # Barge-in: cancel() bumps the generation, the worker drops jobs started under an older one
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._job_generation = 0
+        self._busy = False
+        self._inflight = None
+        self._cancel_started = None
+        self.barge_in_latencies = deque(maxlen=200)
+
         if self.enabled:
             self._start_worker_thread()
 
     def _initialize_engines(self):
         """Initialize all possible TTS engines"""
+        self.stats = {name: EngineStats() for name in ('gtts', 'festival', 'gemini', 'openai')}
+
         try:
             self.engines['gtts'] = GttsEngine(self.lang)
         except Exception as e:
@@ -197,26 +283,18 @@ class TtsManager:
             print(f"Failed to initialize Festival engine: {e}", file=sys.stderr)
 
         try:
-            self.engines['gemini'] = GeminiTtsEngine(self.lang)
+            self.engines['gemini'] = GeminiTtsEngine(self.loop, self.lang)
         except Exception as e:
             print(f"Failed to initialize Gemini engine: {e}", file=sys.stderr)
 
         try:
-            self.engines['openai'] = OpenAiTtsEngine(self.lang)
+            self.engines['openai'] = OpenAiTtsEngine(self.loop, self.lang, stats=self.stats['openai'])
         except Exception as e:
             print(f"Failed to initialize OpenAI engine: {e}", file=sys.stderr)
 
-        #self._audio_player_cmd = [r"c:\\Program Files\\VideoLAN\\VLC\\vlc.exe", "--play-and-exit", "--intf", "dummy"]
-        self._audio_player_cmd = ['ffplay', '-nodisp', '-autoexit', '-loglevel', 'quiet']
-        self._tts_queue = queue.Queue()
-        self._tts_thread = None
-
-        if self.enabled:
-            self._start_worker_thread()
-
     def join(self):
         if self._tts_thread and self._tts_thread.is_alive():
-            self._tts_queue.join()
+            self._jobs.join()
 
     def _start_worker_thread(self):
         self._tts_thread = threading.Thread(target=self._worker, daemon=True)
@@ -224,101 +302,250 @@ class TtsManager:
 
     def _worker(self):
         while self.running:
-            try:
-                queue_item = self._tts_queue.get(timeout=0.1)
-
-                # Handle format: (text, agent, cb, use_streaming, engine_type, voice)
-                if len(queue_item) == 6:
-                    text, agent, cb, use_streaming, engine_type, voice = queue_item
-                elif len(queue_item) == 5:
-                    # Backward compatibility
-                    text, agent, cb, use_streaming, engine_type = queue_item
-                    voice = None
-                else:
-                    # Fallback for old format
-                    text, agent, cb = queue_item[:3]
-                    use_streaming = False
-                    engine_type = 'gtts'
-                    voice = None
-
-                if text is None:
-                    break
-                if not text.strip():
-                    continue
+            job = self._jobs.get()
+            if job is None:
+                break
+            # Cancelled while still waiting in the queue
+            if not job.done.set_running_or_notify_cancel():
+                job.resolve(False)
+                self._jobs.task_done()
+                continue
+            with self._lock:
+                # A cancel() between get() and here already bumped the generation past the job's
+                self._job_generation = job.generation
+                self._busy = True
 
+            engine_type = job.engine_type
+            try:
                 # Get the specified engine
                 engine = self.engines.get(engine_type)
                 if not engine:
                     print(f"Unknown TTS engine: {engine_type}, using gtts", file=sys.stderr)
+                    engine_type = 'gtts'
                     engine = self.engines.get('gtts')
 
+                text, agent, voice, cb = job.text, job.agent, job.voice, job.cb
+                cache_key = self._cache_key(text, agent, engine_type, engine, voice)
+                cached_path = self.cache.get(cache_key) if cache_key and not job.audio_data else None
+
+                if job.audio_data:
+                    # Synthesized ahead of time (prefetch or StoryTRON), keep it for repeated lines
+                    requested_at = time.perf_counter()
+                    self._play_sound(job.audio_data.to_sound(), cb, requested_at)
+                    if cache_key and job.audio_data.cacheable:
+                        self.cache.put(cache_key, job.audio_data.encoded())
+                elif cached_path:
+                    self._play_file(cached_path, cb)
                 # Use streaming mode for OpenAI if requested
-                if use_streaming and isinstance(engine, OpenAiTtsEngine):
-                    asyncio.run(engine.synthesize_and_play_streaming(text, agent, voice))
+                elif job.use_streaming and isinstance(engine, OpenAiTtsEngine):
+                    self._run_abortable(self._play_stream(engine.stream(text, agent, voice)))
                     if cb:
                         cb()
                 else:
                     # Regular synthesis for all other cases
-                    self._regular_synthesis(text, agent, cb, engine, voice)
+                    self._regular_synthesis(text, agent, cb, engine_type, engine, voice, cache_key)
 
-                self._tts_queue.task_done()
+                self._finish_job(job)
 
-            except queue.Empty:
-                continue
             except Exception as e:
-                print(f"[TTS worker error (engine {engine_type}): {e}]", file=sys.stderr)
-                self._tts_queue.task_done()
-
-    def _regular_synthesis(self, text: str, agent: str, cb, engine, voice=None):
-        """Regular file-based synthesis and playback"""
-        if isinstance(engine, GeminiTtsEngine):
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-        else:
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp_file:
-                tmp_path = tmp_file.name
-
-        engine.synthesize(text, tmp_path, agent, voice)
+                if not isinstance(e, CancelledError):
+                    print(f"[TTS worker error (engine {engine_type}): {e}]", file=sys.stderr)
+                self._finish_job(job, played=False)
+
+    def _finish_job(self, job: TtsJob, played=True):
+        with self._lock:
+            self._busy = False
+            barged = self._cancelled()
+        if barged:
+            self._record_barge_in()
+        job.resolve(played and not barged)
+        self._jobs.task_done()
+
+    def _cancelled(self) -> bool:
+        return self._job_generation != self._generation
+
+    def _run_abortable(self, coro):
+        """Run a coroutine on the TTS loop so cancel() can abort it mid-request"""
+        future = self.loop.submit(coro)
+        with self._lock:
+            if self._cancelled():
+                future.cancel()
+            self._inflight = future
+        try:
+            return future.result()
+        finally:
+            self._inflight = None
 
+    def cancel(self):
+        """Barge-in: drop queued lines, abort synthesis in flight and silence playback"""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        dropped = self._jobs.drain()
+        for job in dropped:
+            job.resolve(False)
+
+        with self._lock:
+            busy = self._busy
+            # Bumped even when idle, the worker may hold a job it popped but has not marked busy yet
+            self._generation += 1
+            self._cancel_started = started
+            if not busy and not dropped:
+                return
+            if self._inflight:
+                self._inflight.cancel()
+            audio.stop('tts')
+        if not busy:
+            self._record_barge_in()
+
+    def _record_barge_in(self):
+        # Time until the worker is free again, playback itself stops inside cancel()
+        elapsed = time.perf_counter() - self._cancel_started
+        self.barge_in_latencies.append(elapsed)
+        print(f"[Barge-in: TTS idle after {1000 * elapsed:.0f} ms]", file=sys.stderr, end="\r\n")
+
+    def _cache_key(self, text: str, agent: str, engine_type: str, engine, voice=None):
+        if not self.cache or not engine:
+            return None
+        return self.cache.make_key(engine_type, voice or engine.default_voice, engine.style_prefix(agent), text)
+
+    def _play_file(self, path: str, cb):
+        requested_at = time.perf_counter()
+        self._play_sound(audio.load(path), cb, requested_at)
+
+    def _play_sound(self, sound, cb, requested_at: float):
+        if self._cancelled():
+            return
         if cb:
             cb()
 
-        subprocess.run(
-            self._audio_player_cmd + [tmp_path],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
+        with self._lock:
+            if self._cancelled():
+                return
+            audio.play('tts', sound, requested_at=requested_at)
+        audio.wait('tts')
+
+    async def _play_stream(self, chunks):
+        async for chunk in chunks:
+            sound = chunk.to_sound()
+            while audio.queue_full('tts'):
+                await asyncio.sleep(0.01)
+            with self._lock:
+                if self._cancelled():
+                    return
+                audio.queue('tts', sound)
+
+        while audio.is_busy('tts') or audio.queue_full('tts'):
+            await asyncio.sleep(0.02)
+
+    def _synthesize(self, text: str, agent: str, engine_type: str, engine, voice=None, abortable=False) -> AudioBuffer:
+        started = time.perf_counter()
+        if engine.is_async and abortable:
+            buffer = self._run_abortable(engine.synthesize_async(text, agent, voice))
+        elif engine.is_async:
+            buffer = self.loop.run(engine.synthesize_async(text, agent, voice))
+        else:
+            buffer = engine.synthesize(text, agent, voice)
+        self.stats[engine_type].record(time.perf_counter() - started)
+        return buffer
+
+    def _regular_synthesis(self, text: str, agent: str, cb, engine_type: str, engine, voice=None, cache_key=None):
+        """In-memory synthesis and playback"""
+        buffer = self._synthesize(text, agent, engine_type, engine, voice, abortable=True)
+        requested_at = time.perf_counter()
+        self._play_sound(buffer.to_sound(), cb, requested_at)
 
-        os.remove(tmp_path)
+        if cache_key and buffer.cacheable:
+            self.cache.put(cache_key, buffer.encoded())
 
     def _preprocess_text(self, text: str) -> str:
         processed_text = text.lower()
         processed_text = processed_text.replace('*', '')
         return processed_text
 
-    def say(self, text: str, agent: str, cb=None, use_streaming=False, engine_type='gtts', voice=None):
+    def _speakable(self, processed_text: str) -> bool:
+        # gtts throws at inputs like "."
+        return any(char in string.ascii_letters+string.digits for char in processed_text)
+
+    def prefetch(self, text: str, agent: str, engine_type='gtts', voice=None):
+        """Synthesize without playing so a later say() can start immediately"""
+        if not self.enabled:
+            return None
+        processed_text = self._preprocess_text(text)
+        engine = self.engines.get(engine_type)
+        if not engine or not self._speakable(processed_text):
+            return None
+        cache_key = self._cache_key(processed_text, agent, engine_type, engine, voice)
+        if cache_key and self.cache.contains(cache_key):
+            return None
+        try:
+            return self._synthesize(processed_text, agent, engine_type, engine, voice)
+        except Exception as e:
+            print(f"[TTS prefetch error (engine {engine_type}): {e}]", file=sys.stderr)
+            return None
+
+    async def prefetch_async(self, text: str, agent: str, engine_type='gtts', voice=None):
+        """prefetch() for the asyncio main loop, runs on the long-lived prefetch thread"""
+        if not self.enabled:
+            return None
+        return await asyncio.wrap_future(self._executor.submit(self.prefetch, text, agent, engine_type, voice))
+
+    def say(self, text: str, agent: str, cb=None, use_streaming=False, engine_type='gtts', voice=None, audio_data=None,
+            priority='reply', max_wait=None) -> Future:
+        """Queue text for playback by priority class, audio_data is an already synthesized AudioBuffer"""
+        processed_text = self._preprocess_text(text)
+        # A line still queued after max_wait seconds is stale and dropped
+        if max_wait is None:
+            max_wait = DEFAULT_MAX_WAIT[priority]
+        job = TtsJob(processed_text, agent, engine_type=engine_type, voice=voice, priority=priority, cb=cb,
+                     use_streaming=use_streaming, audio_data=audio_data,
+                     deadline=time.monotonic() + max_wait if max_wait is not None else None)
+        # job.done resolves after playback, cancelling it drops the line while it is still queued
         if not self.enabled:
             # If TTS is disabled, just call the callback immediately
             if cb:
                 cb()
-            return
-
-        try:
-            processed_text = self._preprocess_text(text)
-            # gtts throws at inputs like "."
-            if not any(char in string.ascii_letters+string.digits for char in processed_text):
-                return
-
-            # Put request in queue with engine type and voice
-            self._tts_queue.put_nowait((processed_text, agent, cb, use_streaming, engine_type, voice))
-        except queue.Full:
-            pass
+            job.resolve(False)
+        elif not self._speakable(processed_text):
+            job.resolve(False)
+        else:
+            with self._lock:
+                job.generation = self._generation
+            self._jobs.put(job)
+        return job.done
 
     def shutdown(self):
         self.running = False
+        for job in self._jobs.drain():
+            job.resolve(False)
+        self._jobs.close()
         if self._tts_thread and self._tts_thread.is_alive():
-            self._tts_queue.put_nowait((None, None, None, False, None, None))
             self._tts_thread.join(timeout=1.0)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        festival = self.engines.get('festival')
+        if festival and festival.pool:
+            festival.pool.shutdown()
+        if self.loop:
+            self.loop.stop()
+        print_engine_stats(self.stats)
+        st = self._jobs.stats()
+        classes = []
+        for name in PRIORITIES:
+            c = st[name]
+            if c['played'] or c['dropped'] or c['merged']:
+                wait = f", wait mean {c['wait_mean_ms']:.0f} ms p95 {c['wait_p95_ms']:.0f} ms" if c['played'] else ''
+                classes.append(f"{name} {c['played']} played/{c['dropped']} dropped/{c['merged']} merged{wait}")
+        if classes:
+            print(f"[TTS queue: peak depth {st['peak_depth']}; {'; '.join(classes)}]", file=sys.stderr)
+        if self.barge_in_latencies:
+            samples = sorted(self.barge_in_latencies)
+            print(f"[Barge-in: {len(samples)} cancels, mean {1000 * sum(samples) / len(samples):.0f} ms, "
+                  f"max {1000 * samples[-1]:.0f} ms until TTS idle]", file=sys.stderr)
+        if self.cache:
+            st = self.cache.stats()
+            print(f"[TTS cache: {st['hits']} hits, {st['misses']} misses ({st['hit_rate']:.0%}), "
+                  f"{st['entries']} entries, {st['bytes'] / 1e6:.1f} MB]", file=sys.stderr)
 
 def create_tts_manager() -> TtsManager:
     lang = os.environ.get('RASPITRON_TTS_LANG', 'cs')
@@ -0,0 +1,135 @@
+import os
+import sys
+import hashlib
+import json
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+class TtsCache:
+    """Content-addressed on-disk audio cache with LRU eviction"""
+    SUFFIX = '.audio'
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(unicodedata.normalize('NFC', text).split())
+
+    @classmethod
+    def make_key(cls, engine: str, voice: str, style: str, text: str) -> str:
+        payload = json.dumps([engine, voice or '', style or '', cls.normalize(text)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                # Left behind by a put() interrupted by a crash or power loss
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-len(self.SUFFIX)], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+        self._evict()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str):
+        """Return path of the cached audio or None, counting the lookup"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self.path(key)
+            try:
+                os.utime(path)
+            except OSError:
+                self._size -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return path
+
+    def put(self, key: str, data: bytes):
+        if not data or len(data) > self.max_bytes:
+            return None
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            print(f"TTS cache write failed: {e}", file=sys.stderr)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            self._size -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._size += len(data)
+            self._evict()
+        return self.path(key)
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+def create_tts_cache():
+    try:
+        max_mb = float(os.environ.get('RASPITRON_TTS_CACHE_MB', '64'))
+    except ValueError:
+        max_mb = 64.0
+    if max_mb <= 0:
+        return None
+    directory = os.environ.get('RASPITRON_TTS_CACHE_DIR', os.path.expanduser('~/.cache/raspitron/tts'))
+    try:
+        return TtsCache(directory, int(max_mb * 1024 * 1024))
+    except OSError as e:
+        print(f"TTS cache disabled: {e}", file=sys.stderr)
+        return None
@@ -0,0 +1,149 @@
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+# Lower value plays first
+PRIORITIES = {'reply': 0, 'echo': 1, 'ambient': 2}
+
+# Seconds a job may wait before it is stale and dropped, replies never expire
+DEFAULT_MAX_WAIT = {'reply': None, 'echo': 10.0, 'ambient': 5.0}
+
+class TtsJob:
+    """One line for the TTS worker, done resolves to True once it was played in full"""
+    def __init__(self, text: str, agent: str, engine_type: str = 'gtts', voice: str = None, priority: str = 'reply',
+                 deadline: float = None, cb=None, use_streaming: bool = False, audio_data=None):
+        self.text = text
+        self.agent = agent
+        self.engine_type = engine_type
+        self.voice = voice
+        self.priority = priority
+        # time.monotonic() after which the job is dropped instead of played
+        self.deadline = deadline
+        self.cb = cb
+        self.use_streaming = use_streaming
+        self.audio_data = audio_data
+        self.enqueued_at = time.monotonic()
+        # Barge-in generation the job was queued under, set by TtsManager
+        self.generation = 0
+        self.done = Future()
+        # Futures of later jobs whose text was appended to this one
+        self.merged = []
+
+    def expired(self, now: float) -> bool:
+        return self.deadline is not None and now > self.deadline
+
+    def can_merge(self, other: 'TtsJob') -> bool:
+        plain = lambda job: job.cb is None and job.audio_data is None and not job.use_streaming
+        return (plain(self) and plain(other) and self.priority == other.priority and self.agent == other.agent
+                and self.engine_type == other.engine_type and self.voice == other.voice)
+
+    def resolve(self, played: bool):
+        for future in [self.done] + self.merged:
+            if future.done():
+                continue
+            if future.running() or future.set_running_or_notify_cancel():
+                future.set_result(played)
+
+class JobScheduler:
+    """Priority queue of TTS jobs that sheds stale low-priority work when it backs up"""
+    def __init__(self, max_depth: int = 8):
+        self.max_depth = max_depth
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._unfinished = 0
+        self._closed = False
+        self.peak_depth = 0
+        self.counts = {name: {'played': 0, 'dropped': 0, 'merged': 0} for name in PRIORITIES}
+        self.waits = {name: deque(maxlen=200) for name in PRIORITIES}
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def put(self, job: TtsJob):
+        with self._cond:
+            if len(self._heap) >= self.max_depth // 2 and job.priority != 'reply':
+                for _, _, pending in self._heap:
+                    if pending.can_merge(job):
+                        pending.text = f"{pending.text} {job.text}"
+                        pending.merged.append(job.done)
+                        self.counts[job.priority]['merged'] += 1
+                        return
+            heapq.heappush(self._heap, (PRIORITIES[job.priority], next(self._seq), job))
+            self._unfinished += 1
+            self._shed()
+            self.peak_depth = max(self.peak_depth, len(self._heap))
+            self._cond.notify()
+
+    def _shed(self):
+        """Drop the oldest job of the lowest priority until the queue fits, replies are kept"""
+        while len(self._heap) > self.max_depth:
+            victims = [entry for entry in self._heap if entry[2].priority != 'reply']
+            if not victims:
+                return
+            victim = max(victims, key=lambda entry: (entry[0], -entry[1]))
+            self._heap.remove(victim)
+            heapq.heapify(self._heap)
+            self._drop(victim[2])
+
+    def _drop(self, job: TtsJob):
+        self.counts[job.priority]['dropped'] += 1
+        self._unfinished -= 1
+        job.resolve(False)
+        self._cond.notify_all()
+
+    def get(self, timeout: float = None):
+        """Next job by priority, None once closed or after timeout"""
+        with self._cond:
+            while True:
+                while not self._heap and not self._closed:
+                    if not self._cond.wait(timeout):
+                        return None
+                if self._closed:
+                    return None
+                _, _, job = heapq.heappop(self._heap)
+                now = time.monotonic()
+                if job.expired(now):
+                    self._drop(job)
+                    continue
+                self.waits[job.priority].append(now - job.enqueued_at)
+                self.counts[job.priority]['played'] += 1
+                return job
+
+    def task_done(self):
+        with self._cond:
+            self._unfinished -= 1
+            self._cond.notify_all()
+
+    def join(self):
+        with self._cond:
+            while self._unfinished > 0 and not self._closed:
+                self._cond.wait()
+
+    def drain(self) -> list:
+        """Remove every queued job, the caller resolves them"""
+        with self._cond:
+            jobs = [job for _, _, job in sorted(self._heap)]
+            self._heap.clear()
+            self._unfinished -= len(jobs)
+            self._cond.notify_all()
+        return jobs
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            result = {'depth': len(self._heap), 'peak_depth': self.peak_depth}
+            for name in PRIORITIES:
+                waits = sorted(self.waits[name])
+                result[name] = dict(self.counts[name],
+                                    wait_mean_ms=1000 * sum(waits) / len(waits) if waits else None,
+                                    wait_p95_ms=1000 * waits[int(0.95 * (len(waits) - 1))] if waits else None)
+            return result
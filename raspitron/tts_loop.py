@@ -0,0 +1,70 @@
+import sys
+import asyncio
+import threading
+from collections import deque
+
+import httpx
+
+class AsyncLoop:
+    """Long-lived event loop thread owning the async TTS clients"""
+    def __init__(self, name: str = 'tts-loop'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop, returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=1.0)
+
+class EngineStats:
+    """Per-engine call latency and HTTP connection reuse"""
+    def __init__(self):
+        self.latencies = deque(maxlen=200)
+        self.requests = 0
+        self.new_connections = 0
+
+    def record(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def summary(self) -> str:
+        samples = sorted(self.latencies)
+        if not samples:
+            return "no calls"
+        text = (f"{len(samples)} calls, mean {1000 * sum(samples) / len(samples):.0f} ms, "
+                f"p95 {1000 * samples[int(0.95 * (len(samples) - 1))]:.0f} ms")
+        if self.requests:
+            reused = self.requests - self.new_connections
+            text += f", {reused}/{self.requests} requests on reused connections"
+        return text
+
+class TracingTransport(httpx.AsyncHTTPTransport):
+    """Counts requests and freshly opened connections via httpcore trace events"""
+    def __init__(self, stats: EngineStats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        self.stats.requests += 1
+        request.extensions['trace'] = self._trace
+        return await super().handle_async_request(request)
+
+    async def _trace(self, event_name: str, info: dict):
+        if event_name == 'connection.connect_tcp.started':
+            self.stats.new_connections += 1
+
+def print_engine_stats(stats: dict):
+    for name, st in stats.items():
+        if st.latencies:
+            print(f"[TTS {name}: {st.summary()}]", file=sys.stderr)
@@ -42,6 +42,8 @@ class BaseAgent:
         self.enable_memory = enable_memory
         self.memory_size = memory_size
         self.conversation_memory = deque(maxlen=memory_size) if enable_memory else None
+        # MemoryLog that persists every exchange, set by the owning Story
+        self.memory_log = None
 
     def chat(self, message):
         raise NotImplementedError()
@@ -58,6 +60,8 @@ class BaseAgent:
             "agent": agent_response
         }
         self.conversation_memory.append(exchange)
+        if self.memory_log is not None:
+            self.memory_log.append(exchange, self.conversation_memory)
 
     def get_conversation_history(self, include_system_prompt=True):
         """Get conversation history formatted for OpenAI API"""
@@ -89,6 +93,8 @@ class BaseAgent:
         """Clear conversation memory"""
         if self.enable_memory and self.conversation_memory is not None:
             self.conversation_memory.clear()
+            if self.memory_log is not None:
+                self.memory_log.compact(self.conversation_memory)
 
     def get_memory_state(self):
         """Get memory state for persistence"""
@@ -8,7 +8,7 @@ class ConfessorAgent(OpenAIAgent):
         self.secrets_revealed = []
 
     def chat(self, message):
-        if not self.client:
+        if not self.has_backend():
             return "CHYBA: BOŽSKÉ SPOJENÍ PŘERUŠENO... OpenAI API klíč není nakonfigurován"
 
         # Check if message contains confessional content
@@ -70,10 +70,7 @@ Zoufale chceš, aby se ti lidé zpovídali ze svých hříchů, zločinů a prov
             # Add current message
             messages.append({"role": "user", "content": message})
 
-            response = self.client.responses.create(
-                model="gpt-5-mini",
-                input=messages
-            )
+            response = self.create_response(messages)
 
             agent_response = response.output_text.strip()
 
@@ -42,7 +42,7 @@ class JoystickAgent(OpenAIAgent):
 
     def mystical_fortune_teller_response(self, user_message):
         """Generate mystical fortune teller response"""
-        if not self.client:
+        if not self.has_backend():
             return "🔮 CHYBA: Mystické spojení přerušeno... OpenAI API klíč není nakonfigurován"
 
         try:
@@ -84,11 +84,7 @@ Mluvíš výhradně česky, udržuj odpovědi pod 100 slovy, buď mystický a z
             # Add current user message
             messages.append({"role": "user", "content": user_message})
 
-            # Revert to original API call format
-            response = self.client.responses.create(
-                model="gpt-5-mini",
-                input=messages
-            )
+            response = self.create_response(messages)
 
             # Revert to original response parsing
             agent_response = response.output_text.strip()
@@ -101,7 +97,7 @@ Mluvíš výhradně česky, udržuj odpovědi pod 100 slovy, buď mystický a z
 
     def aida_obsessed_response(self, user_message):
         """Generate Aida-obsessed response after quest completion"""
-        if not self.client:
+        if not self.has_backend():
             return "AIDA! CHYBA AIDA! OpenAI AIDA API klíč AIDA není AIDA nakonfigurován AIDA!"
 
         try:
@@ -130,11 +126,7 @@ Mluvíš výhradně česky, udržuj odpovědi pod 100 slovy, buď posedlý Aidou
             # Add current user message
             messages.append({"role": "user", "content": user_message})
 
-            # Revert to original API call format
-            response = self.client.responses.create(
-                model="gpt-5-mini",
-                input=messages
-            )
+            response = self.create_response(messages)
 
             # Revert to original response parsing
             agent_response = response.output_text.strip()
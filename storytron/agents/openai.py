@@ -1,51 +1,85 @@
 import os
+import time
 import openai
 from .base import BaseAgent
 from .prompt_loader import load_prompt
+from usage import usage_from_response
+from local_llm import local_model, FALLBACK_AFTER
 
 
 class OpenAIAgent(BaseAgent):
+    model = "gpt-5-mini"
+
     def __init__(self, agent_id, name, memory_size=50, enable_memory=True, load_system_prompt=True, tts_engine='gtts', tts_voice=None):
         super().__init__(agent_id, name, memory_size, enable_memory, tts_engine, tts_voice)
         self._client = None
         self.load_system_prompt = load_system_prompt
+        # SessionBudget of the owning session, None means unlimited
+        self.budget = None
+        self.last_usage = None
 
-        if load_system_prompt:
-            system_prompt = load_prompt(agent_id, self.satisfied)
-            self.conversation_history = [{"role": "system", "content": system_prompt}]
-        else:
-            self.conversation_history = []
+    @property
+    def conversation_history(self):
+        """System prompt for the current satisfaction state, read on every turn."""
+        # A hot session keeps its agents, so satisfaction changes and prompt edits must not be cached here
+        if not self.load_system_prompt:
+            return []
+        return [{"role": "system", "content": load_prompt(self.agent_id, self.satisfied)}]
 
     @property
     def client(self):
         if self._client is None and os.environ.get('OPENAI_API_KEY'):
+            # With a local model to fall back on, a dead hotspot should not hold the player for minutes
+            fallback = local_model.available
             self._client = openai.OpenAI(
                 api_key=os.environ.get('OPENAI_API_KEY'),
-                timeout=45,
-                max_retries=2  # Retry failed requests twice
+                timeout=FALLBACK_AFTER if fallback else 45,
+                max_retries=0 if fallback else 2  # Retry failed requests twice, or go local right away
             )
         return self._client
 
+    def has_backend(self):
+        return self.client is not None or local_model.available
+
+    def call_model(self, messages):
+        """responses.create within the session budget, or the local model, returns (response, usage)."""
+        if local_model.use_for(self.agent_id) or (self.client is None and local_model.available):
+            response, usage = local_model.complete(messages)
+        else:
+            model = self.model
+            if self.budget is not None:
+                model, messages = self.budget.plan(model, messages)
+            started = time.perf_counter()
+            try:
+                response = self.client.responses.create(model=model, input=messages)
+            except (openai.APITimeoutError, openai.APIConnectionError):
+                if not local_model.available:
+                    raise
+                local_model.remote_failed()
+                response, usage = local_model.complete(messages)
+            else:
+                usage = usage_from_response(response, model, time.perf_counter() - started)
+        if self.budget is not None:
+            self.budget.record(self.agent_id, usage)
+        return response, usage
+
+    def create_response(self, messages):
+        """call_model for the reply of a turn, its usage is kept in last_usage."""
+        response, self.last_usage = self.call_model(messages)
+        return response
+
     def chat(self, message):
-        if not self.client:
+        if not self.has_backend():
             return "Error: OpenAI API key not configured"
 
         try:
-            # Add the user message to conversation history
-            self.conversation_history.append({"role": "user", "content": message})
-
-            # Send the full conversation history to the API
-            response = self.client.responses.create(
-                model="gpt-5-mini",
-                input=self.conversation_history
-            )
+            # The agent lives as long as its session stays hot, so the turn is not kept in
+            # conversation_history, otherwise the context would grow until the session is evicted
+            response = self.create_response(self.conversation_history + [{"role": "user", "content": message}])
 
             # Get the assistant's response
             assistant_response = response.output_text.strip()
 
-            # Add the assistant's response to conversation history
-            self.conversation_history.append({"role": "assistant", "content": assistant_response})
-
             return assistant_response
         except Exception as e:
             return f"Error: {str(e)}"
@@ -1,6 +1,19 @@
 import os
 import warnings
 
+# Prompt text by path, kept until the file's mtime changes
+_prompt_cache = {}
+
+def _read_prompt(prompt_file):
+    mtime = os.stat(prompt_file).st_mtime_ns
+    cached = _prompt_cache.get(prompt_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(prompt_file, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    _prompt_cache[prompt_file] = (mtime, content)
+    return content
+
 def load_prompt(agent_id, satisfied=False):
     """Load system prompt for an agent from file."""
     if satisfied:
@@ -13,8 +26,7 @@ def load_prompt(agent_id, satisfied=False):
         prompt_file = os.path.join(os.path.dirname(__file__), '..', 'prompts', f'{agent_id}.txt')
 
     try:
-        with open(prompt_file, 'r', encoding='utf-8') as f:
-            return f.read().strip()
+        return _read_prompt(prompt_file)
     except FileNotFoundError:
         return f"Error: Prompt file not found for agent {agent_id}"
 
@@ -27,6 +39,8 @@ def save_prompt(agent_id, content, satisfied=False):
     os.makedirs(os.path.dirname(prompt_file), exist_ok=True)
     with open(prompt_file, 'w', encoding='utf-8') as f:
         f.write(content)
+    # Coarse mtimes could make an edit within the same tick look unchanged
+    _prompt_cache.pop(prompt_file, None)
 
 def list_available_prompts():
     """List all available prompt files."""
@@ -38,6 +52,9 @@ def list_available_prompts():
     satisfied_prompts = []
     for filename in os.listdir(prompts_dir):
         if filename.endswith('.txt'):
+            if filename.endswith('_opening.txt'):
+                # Opening line instructions, read by load_opening(), not agent prompts
+                continue
             if filename.endswith('_satisfied.txt'):
                 agent_id = filename[:-14]  # Remove _satisfied.txt extension
                 satisfied_prompts.append(agent_id)
@@ -47,6 +64,23 @@ def list_available_prompts():
 
     return sorted(prompts), sorted(satisfied_prompts)
 
+def preload_prompts():
+    """Read every prompt file into the cache."""
+    regular_prompts, satisfied_prompts = list_available_prompts()
+    for agent_id in regular_prompts:
+        load_prompt(agent_id)
+    for agent_id in satisfied_prompts:
+        load_prompt(agent_id, satisfied=True)
+    return len(_prompt_cache)
+
+def load_opening(agent_id):
+    """Instruction for an agent's opening line from <agent_id>_opening.txt, None if it has none."""
+    prompt_file = os.path.join(os.path.dirname(__file__), '..', 'prompts', f'{agent_id}_opening.txt')
+    try:
+        return _read_prompt(prompt_file)
+    except FileNotFoundError:
+        return None
+
 def has_satisfied_prompt(agent_id):
     """Check if an agent has a satisfied prompt file."""
     prompt_file = os.path.join(os.path.dirname(__file__), '..', 'prompts', f'{agent_id}_satisfied.txt')
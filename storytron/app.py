@@ -1,14 +1,26 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, send_file, g, abort, make_response
 from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 import jsonlines
+from contextlib import ExitStack
 from datetime import datetime
 from dotenv import load_dotenv
 from agents.joystick import JoystickAgent
 from agents.confessor import ConfessorAgent
 from agents.openai import OpenAIAgent
-from agents.prompt_loader import load_prompt, save_prompt, list_available_prompts
+from agents.prompt_loader import load_prompt, save_prompt, list_available_prompts, preload_prompts
 from story import Story
+from tts import TtsSynthesizer, DIGEST_RE
+from compression import GzipRequestMiddleware, compress_response, transfer_stats
+from conditional import versioned, file_version, dir_version
+from idempotency import IdempotencyCache, IdempotencyConflict
+from jobs import ChatJobs, PENDING
+from sessions import SessionStore, SESSIONS_DIR, DEFAULT_SESSION
+from usage import UsageLedger
+from memory_log import write_stats
+from request_log import RequestLogger, log_fields
+from speculation import Speculator, SPECULATE
+from local_llm import local_model, stream_to
 import json
 
 
@@ -16,9 +28,14 @@ import json
 load_dotenv()
 
 app = Flask(__name__)
-app.wsgi_app = ProxyFix(
+app.wsgi_app = GzipRequestMiddleware(ProxyFix(
     app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1
-)
+))
+# The request log is registered first so it sees the final, compressed size
+request_logger = RequestLogger()
+request_logger.init_app(app)
+# Registered early so it runs after the other after_request hooks, which read the plain body
+app.after_request(compress_response)
 
 # Configuration from environment variables
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -29,61 +46,70 @@ app.config['OPENAI_API_KEY'] = os.environ.get('OPENAI_API_KEY')
 
 HISTORY_FILE = os.environ.get('HISTORY_FILE', 'message_history.jsonl')
 
-@app.before_request
-def log_request():
-    if request.path.startswith('/api/chat'):
-        message = ""
-        if request.is_json:
-            try:
-                data = request.get_json()
-                message = data.get('message', '').replace('\n', ' ')[:100]
-            except:
-                message = "[JSON parse error]"
-        print(f"{datetime.now()} - {request.method} {request.path} - message: {message}")
+# Server-side TTS for clients that ask for it with "tts": true in /api/chat
+tts_synthesizer = TtsSynthesizer() if os.environ.get('STORYTRON_TTS', '1') != '0' else None
+# Stay below the raspitron read timeout
+TTS_MAX_WAIT = 25.0
 
-@app.after_request
-def log_response(response):
-    if request.path.startswith('/api/chat'):
-        agent_response = ""
-        try:
-            response_data = json.loads(response.get_data(as_text=True))
-            agent_response = response_data.get('agent_response', '').replace('\n', ' ')[:100]
-        except:
-            agent_response = "[Response parse error]"
-        print(f"{datetime.now()} - {response.status_code} {request.path} - agent_response: {agent_response}")
-    return response
+# Retried /api/chat requests with the same Idempotency-Key reuse the first generation
+idempotency = IdempotencyCache()
+IDEMPOTENCY_WAIT = float(os.environ.get('STORYTRON_IDEMPOTENCY_WAIT', '120'))
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts')
+
+# Admin pages opened with ?session= keep showing that session
+SESSION_COOKIE = 'storytron_session'
+
+# Versions only stat files, the session's story is not loaded
+def state_version():
+    session_id = request_session_id()
+    return file_version(sessions.paths(session_id)[0]) + (session_id,)
+
+def history_version():
+    session_id = request_session_id()
+    return file_version(sessions.paths(session_id)[1]) + (session_id,)
+
+def sessions_version():
+    return dir_version(SESSIONS_DIR, suffix='') + (request_session_id(),)
+
+def prompts_version():
+    return dir_version(PROMPTS_DIR)
+
+def static_version():
+    return (0,)
 
-def load_history():
+def load_history(path):
     history = []
-    if os.path.exists(HISTORY_FILE):
+    if os.path.exists(path):
         try:
-            with jsonlines.open(HISTORY_FILE) as reader:
+            with jsonlines.open(path) as reader:
                 for entry in reader:
                     history.append(entry)
         except Exception as e:
             print(f"Error loading history: {e}")
     return history
 
-def save_history(history):
+def save_history(path, history):
     try:
-        with jsonlines.open(HISTORY_FILE, mode='w') as writer:
+        with jsonlines.open(path, mode='w') as writer:
             for entry in history:
                 writer.write(entry)
     except Exception as e:
         print(f"Error saving history: {e}")
 
-def append_to_history(entry):
+def append_to_history(path, entry):
     try:
-        with jsonlines.open(HISTORY_FILE, mode='a') as writer:
+        with jsonlines.open(path, mode='a') as writer:
             writer.write(entry)
     except Exception as e:
         print(f"Error appending to history: {e}")
 
-def get_current_history():
-    return load_history()
+# Token usage per session and agent, budgets degrade the model calls of a session
+usage_ledger = UsageLedger()
+# Agents that become active warm up in the background, shared by all sessions
+speculator = Speculator() if SPECULATE else None
 
-def get_story():
-    """Get a fresh story instance with loaded state for each request."""
+def build_story(session_id, state_file):
     story = Story([
         OpenAIAgent("start", "Start Agent"),
         OpenAIAgent("shot_out_eye", "ShotOutEye Agent"),
@@ -98,16 +124,57 @@ def get_story():
         OpenAIAgent("final_boss_4", "Final Boss Stage 4"),
         OpenAIAgent("nahodny_kolemjdouci", "Náhodný Kolemjdoucí"),
         ConfessorAgent()
-    ])
+    ], state_file=state_file)
+    budget = usage_ledger.for_session(session_id)
+    for agent in story.agents.values():
+        agent.budget = budget
+    story.speculator = speculator
+    return story
 
-    # Initialize state file from default if it doesn't exist
-    if not os.path.exists('story_state.json'):
-        if os.path.exists('default_story_state.json'):
-            import shutil
-            shutil.copy('default_story_state.json', 'story_state.json')
+# Every session plays its own game, recently used ones stay loaded
+sessions = SessionStore(build_story, HISTORY_FILE)
 
-    story.load_state()
-    return story
+def request_session_id():
+    """X-Session-Id header, ?session=, "session" in the body or form, then the admin cookie."""
+    body = request.get_json(silent=True) if request.is_json else None
+    session_id = (request.headers.get('X-Session-Id') or request.args.get('session')
+                  or (body.get('session') if isinstance(body, dict) else None)
+                  or request.form.get('session') or request.cookies.get(SESSION_COOKIE)
+                  or DEFAULT_SESSION)
+    if not sessions.valid(session_id):
+        abort(make_response(jsonify({'error': f'Invalid session id: {session_id}'}), 400))
+    return session_id
+
+def current_session():
+    return sessions.get(request_session_id())
+
+def get_story():
+    """Story of the request's session, the session stays locked until the request ends."""
+    if 'story_session' not in g:
+        g.session_scope = ExitStack()
+        g.story_session = g.session_scope.enter_context(sessions.use(request_session_id()))
+    return g.story_session.story
+
+@app.teardown_request
+def release_session(error=None):
+    scope = g.pop('session_scope', None)
+    if scope is not None:
+        scope.close()
+
+@app.after_request
+def remember_session(response):
+    session_id = request.args.get('session')
+    if request.path.startswith('/web') and session_id and sessions.valid(session_id):
+        response.set_cookie(SESSION_COOKIE, session_id, samesite='Lax')
+    # Cached TTS audio is the same for every session
+    if not request.path.startswith('/api/tts/'):
+        response.vary.add('Cookie')
+        response.vary.add('X-Session-Id')
+    return response
+
+@app.context_processor
+def inject_sessions():
+    return {'session_id': request_session_id(), 'session_ids': sessions.known()}
 
 @app.route('/')
 def pomo_interface():
@@ -131,9 +198,11 @@ def dashboard():
     return render_template('dashboard.html',
                         status=status,
                         agents={'agents': available_agents, 'active_agent': story.current_id},
+                        usage=usage_ledger.session_view(g.story_session.id),
                         timestamp=datetime.now().strftime('%H:%M:%S'))
 
 @app.route('/web/agents')
+@versioned(state_version, sessions_version)
 def web_agents():
     story = get_story()
     available_agents = story.to_listing()
@@ -141,10 +210,12 @@ def web_agents():
                          agents={'agents': available_agents, 'active_agent': story.current_id})
 
 @app.route('/web/history')
+@versioned(sessions_version)
 def web_history():
     return render_template('history.html')
 
 @app.route('/web/prompts')
+@versioned(prompts_version, sessions_version)
 def web_prompts():
     regular_prompts, satisfied_prompts = list_available_prompts()
     prompts_data = []
@@ -216,6 +287,7 @@ def reset_story():
     return redirect(url_for('web_agents'))
 
 @app.route('/api/agents', methods=['GET'])
+@versioned(state_version)
 def list_agents():
     story = get_story()
     available_agents = story.to_listing()
@@ -259,7 +331,6 @@ def toggle_agent_satisfaction_api(agent_id):
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
-    story = get_story()
     data = request.get_json()
 
     if not data or 'message' not in data:
@@ -267,6 +338,58 @@ def chat():
             'error': 'Message is required'
         }), 400
 
+    data = dict(data, session=request_session_id())
+    log_fields(session=data['session'], message=data.get('message'))
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    if not key:
+        return jsonify(logged_result(chat_turn(data)))
+
+    try:
+        # Only the message identifies the turn, an outbox replay may differ in sender or tts
+        entry, owner = idempotency.begin(key, data.get('message'))
+    except IdempotencyConflict:
+        return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+
+    if not owner:
+        result = idempotency.wait(entry, IDEMPOTENCY_WAIT)
+        if result is None:
+            response = jsonify({'error': 'Request with this Idempotency-Key is still in progress'})
+            response.headers['Retry-After'] = '2'
+            return response, 409
+        response = jsonify(logged_result(result))
+        response.headers['Idempotent-Replayed'] = 'true'
+        log_fields(replayed=True)
+        return response
+
+    try:
+        result = chat_turn(data)
+    except Exception:
+        idempotency.abandon(key, entry)
+        raise
+    idempotency.finish(entry, result)
+    return jsonify(logged_result(result))
+
+def logged_result(result):
+    log_fields(agent=result['active_agent'], reply=result['agent_response'])
+    return result
+
+def chat_turn(data):
+    """Run one story turn and record it in history, returns the response body."""
+    # Turns of one session must not interleave, other sessions run in parallel
+    with sessions.use(data.get('session', DEFAULT_SESSION)) as session:
+        result = story_turn(session, data)
+
+    if data.get('tts') and tts_synthesizer:
+        # The reply does not wait for synthesis, fetching audio_url does
+        digest = tts_synthesizer.submit(result['agent_response'], result['active_agent'],
+                                        result['tts_engine'], result['tts_voice'])
+        if digest:
+            result['audio_url'] = f'/api/tts/{digest}'
+
+    return result
+
+def story_turn(session, data):
+    story = session.story
     message = data.get('message', '')
     sender = data.get('sender', 'web')  # 'web' or 'pomo'
 
@@ -281,12 +404,13 @@ def chat():
         'sender': sender,
         'message': message,
         'response': agent_response,
-        'agent': story.current_id
+        'agent': story.current_id,
+        'usage': story.last_usage
     }
 
-    append_to_history(entry)
+    append_to_history(session.history_file, entry)
 
-    return jsonify({
+    result = {
         'active_agent': story.current_id,
         'user_message': message,
         'agent_response': agent_response,
@@ -294,11 +418,85 @@ def chat():
         'tts_engine': story.active_agent.tts_engine,
         'tts_voice': story.active_agent.tts_voice,
         'victory': story.active_agent.is_satisfied() and story.current_id == "tradicni"
-    })
+    }
+    return result
+
+# Long generations run as jobs so no proxy has to hold the connection open for them
+chat_jobs = ChatJobs(chat_turn, stream=stream_to)
+# Stay below nginx proxy_read_timeout
+JOB_MAX_WAIT = 50.0
+
+def job_view(job):
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'created': job['created'],
+        'result': job['result'],
+        'error': job['error'],
+        'poll_url': f"/api/chat/jobs/{job['id']}",
+        'events_url': f"/api/chat/jobs/{job['id']}/events",
+    }
+
+@app.route('/api/chat/jobs', methods=['POST'])
+def submit_chat_job():
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return jsonify({'error': 'Message is required'}), 400
+
+    data = dict(data, session=request_session_id())
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    job, _ = chat_jobs.submit(data, key)
+    log_fields(session=data['session'], message=data.get('message'), job_id=job['id'])
+    return jsonify(job_view(job)), 202
+
+@app.route('/api/chat/jobs/<job_id>', methods=['GET'])
+def get_chat_job(job_id):
+    """Job state, ?wait=N long-polls up to N seconds for the result."""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), JOB_MAX_WAIT)
+    except ValueError:
+        wait = 0.0
+    job = chat_jobs.get(job_id, wait)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} not found'}), 404
+    log_fields(job_id=job_id, job_status=job['status'])
+    if job['status'] == 'done':
+        logged_result(job['result'])
+    if job['status'] in PENDING:
+        return jsonify(job_view(job)), 202
+    return jsonify(job_view(job)), 200 if job['status'] == 'done' else 500
+
+@app.route('/api/chat/jobs/<job_id>/events', methods=['GET'])
+def chat_job_events(job_id):
+    """Server-sent events with every status change and streamed reply text until the job finishes."""
+    def stream():
+        last_status = None
+        sent = 0
+        while True:
+            job, text = chat_jobs.follow(job_id, last_status, sent, wait=15)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': f'Job {job_id} not found'})}\n\n"
+                return
+            streamed = len(text) > sent
+            if streamed:
+                # Only the local model streams, OpenAI replies arrive whole with the done status
+                yield f"event: delta\ndata: {json.dumps({'text': text[sent:]}, ensure_ascii=False)}\n\n"
+                sent = len(text)
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(job_view(job), ensure_ascii=False)}\n\n"
+            elif not streamed:
+                yield ": keep-alive\n\n"
+            if job['status'] not in PENDING:
+                return
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/history', methods=['GET'])
+@versioned(history_version)
 def get_history():
-    current_history = get_current_history()
+    current_history = load_history(current_session().history_file)
     return jsonify({
         'history': current_history,
         'count': len(current_history)
@@ -307,9 +505,10 @@ def get_history():
 @app.route('/api/history', methods=['DELETE'])
 def clear_history():
     # Remove history file
-    if os.path.exists(HISTORY_FILE):
+    history_file = current_session().history_file
+    if os.path.exists(history_file):
         try:
-            os.remove(HISTORY_FILE)
+            os.remove(history_file)
         except Exception as e:
             print(f"Error removing history file: {e}")
 
@@ -319,7 +518,8 @@ def clear_history():
 def delete_history_message(timestamp):
     """Delete a specific message from history by timestamp."""
     try:
-        current_history = load_history()
+        history_file = current_session().history_file
+        current_history = load_history(history_file)
         # Filter out the message with the specified timestamp
         filtered_history = [msg for msg in current_history if msg.get('timestamp') != timestamp]
 
@@ -327,7 +527,7 @@ def delete_history_message(timestamp):
             return jsonify({'error': 'Message not found'}), 404
 
         # Save the filtered history back
-        save_history(filtered_history)
+        save_history(history_file, filtered_history)
 
         return jsonify({
             'message': 'Message deleted successfully',
@@ -384,13 +584,14 @@ def clear_agent_history(agent_id):
         agent.clear_memory()  # This will also reset quest state for joystick agent
 
     # Load current history
-    current_history = load_history()
+    history_file = current_session().history_file
+    current_history = load_history(history_file)
 
     # Filter out messages from this specific agent
     filtered_history = [entry for entry in current_history if entry.get('agent') != agent_id]
 
     # Save the filtered history back
-    save_history(filtered_history)
+    save_history(history_file, filtered_history)
 
     removed_count = len(current_history) - len(filtered_history)
 
@@ -408,7 +609,7 @@ def get_agent_history_count(agent_id):
         return jsonify({'error': f'Agent {agent_id} not found'}), 404
 
     # Load current history and count messages for this agent
-    current_history = load_history()
+    current_history = load_history(current_session().history_file)
     agent_history_count = sum(1 for entry in current_history if entry.get('agent') == agent_id)
 
     return jsonify({
@@ -418,6 +619,7 @@ def get_agent_history_count(agent_id):
     })
 
 @app.route('/api/prompts', methods=['GET'])
+@versioned(prompts_version)
 def list_prompts():
     """List all available prompts."""
     regular_prompts, satisfied_prompts = list_available_prompts()
@@ -467,6 +669,7 @@ def list_prompts():
     })
 
 @app.route('/api/prompts/<agent_id>', methods=['GET'])
+@versioned(prompts_version)
 def get_prompt(agent_id):
     """Get prompt content for a specific agent."""
     try:
@@ -556,7 +759,20 @@ def update_agent_tts_config(agent_id):
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/tts/<digest>', methods=['GET'])
+def get_tts_audio(digest):
+    """Serve synthesized audio by content hash, waiting for a synthesis still in progress."""
+    if not tts_synthesizer or not DIGEST_RE.match(digest):
+        return jsonify({'error': 'Audio not found'}), 404
+    path = tts_synthesizer.audio(digest, wait=TTS_MAX_WAIT)
+    if path is None:
+        if tts_synthesizer.pending(digest):
+            return jsonify({'error': 'Audio is still being synthesized'}), 503, {'Retry-After': '2'}
+        return jsonify({'error': 'Audio not found'}), 404
+    return send_file(os.path.abspath(path), mimetype='audio/wav', max_age=365 * 24 * 3600)
+
 @app.route('/api/tts/engines', methods=['GET'])
+@versioned(static_version)
 def get_tts_engines():
     """Get available TTS engines and their supported voices."""
     from agents.base import BaseAgent
@@ -564,6 +780,69 @@ def get_tts_engines():
         'engines': BaseAgent.TTS_ENGINES
     })
 
+@app.route('/api/sessions', methods=['GET'])
+def list_sessions():
+    """Known sessions and which of them are loaded in memory."""
+    return jsonify(dict(sessions.stats(), sessions=sessions.known()))
+
+@app.route('/api/stats/usage', methods=['GET'])
+def get_usage_stats():
+    """Tokens, latency and cost per session and agent, with the budget level of each session."""
+    return jsonify(usage_ledger.snapshot())
+
+@app.route('/api/stats/memory', methods=['GET'])
+def get_memory_stats():
+    """Bytes written per chat turn for state and memory logs, and the replay time of loads."""
+    return jsonify(write_stats.snapshot())
+
+@app.route('/api/stats/logging', methods=['GET'])
+def get_logging_stats():
+    return jsonify(request_logger.stats())
+
+@app.route('/api/stats/speculation', methods=['GET'])
+def get_speculation_stats():
+    """Opening lines served from warm-up, missed, and generated for nothing with their tokens."""
+    if not speculator:
+        return jsonify({'enabled': False})
+    return jsonify(dict(speculator.stats(), enabled=True))
+
+@app.route('/api/stats/local', methods=['GET'])
+def get_local_model_stats():
+    """Local model state, fallbacks from the remote API and measured generation speed."""
+    return jsonify(local_model.stats())
+
+@app.route('/api/stats/tts', methods=['GET'])
+def get_tts_stats():
+    """Server TTS cache size, evictions and syntheses in progress."""
+    if not tts_synthesizer:
+        return jsonify({'enabled': False})
+    return jsonify(dict(tts_synthesizer.stats(), enabled=True))
+
+@app.route('/api/stats/idempotency', methods=['GET'])
+def get_idempotency_stats():
+    """Chat generations run versus retries answered from the idempotency cache."""
+    return jsonify(idempotency.stats())
+
+@app.route('/api/stats/jobs', methods=['GET'])
+def get_job_stats():
+    return jsonify(chat_jobs.stats())
+
+@app.route('/api/stats/transfer', methods=['GET'])
+def get_transfer_stats():
+    """Bytes sent, saved by compression and saved by 304 answers per endpoint."""
+    return jsonify({'endpoints': transfer_stats.snapshot()})
+
+def preload():
+    """Read prompts and load the default session before a server forks its workers."""
+    preload_prompts()
+    with sessions.use(DEFAULT_SESSION):
+        pass
+
+def flush_pending():
+    """Let running chat jobs write their result and drain the request log, before a worker exits."""
+    chat_jobs.shutdown(wait=True)
+    request_logger.flush()
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -579,4 +858,5 @@ def internal_error(error):
     }), 500
 
 if __name__ == '__main__':
+    chat_jobs.start()
     app.run(host=app.config['HOST'], port=app.config['PORT'], debug=False)
@@ -0,0 +1,108 @@
+import io
+import gzip
+import zlib
+import threading
+
+from flask import request
+
+# Refuse request bodies that inflate beyond this, protects against gzip bombs
+MAX_INFLATED_BYTES = 1024 * 1024
+
+
+class GzipRequestMiddleware:
+    """WSGI middleware that transparently inflates gzip-encoded request bodies."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if environ.get('HTTP_CONTENT_ENCODING', '').lower() == 'gzip':
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+            try:
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body = inflater.decompress(environ['wsgi.input'].read(length), MAX_INFLATED_BYTES)
+                if inflater.unconsumed_tail:
+                    raise ValueError("request body too large")
+            except (zlib.error, ValueError):
+                start_response('400 Bad Request', [('Content-Type', 'application/json')])
+                return [b'{"error": "Invalid gzip request body"}']
+            environ['wsgi.input'] = io.BytesIO(body)
+            environ['CONTENT_LENGTH'] = str(len(body))
+            del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
+
+
+# Response compression for the read endpoints polled by the web UI
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/css', 'application/javascript', 'text/plain')
+
+
+class TransferStats:
+    """Per-endpoint bytes before and after compression plus 304 answers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _entry(self, endpoint):
+        return self._endpoints.setdefault(endpoint, {
+            'responses': 0, 'not_modified': 0, 'raw_bytes': 0, 'sent_bytes': 0, 'saved_bytes': 0, 'last_size': 0
+        })
+
+    def record(self, endpoint, raw_size, sent_size):
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry['responses'] += 1
+            entry['raw_bytes'] += raw_size
+            entry['sent_bytes'] += sent_size
+            entry['saved_bytes'] += raw_size - sent_size
+            entry['last_size'] = raw_size
+
+    def record_not_modified(self, endpoint):
+        """A 304 saves the whole payload, estimated by the last full response."""
+        with self._lock:
+            entry = self._entry(endpoint)
+            entry['not_modified'] += 1
+            entry['saved_bytes'] += entry['last_size']
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: dict(entry) for endpoint, entry in self._endpoints.items()}
+
+
+transfer_stats = TransferStats()
+
+
+def _choose_encoding(accept_encoding):
+    if brotli is not None and 'br' in accept_encoding:
+        return 'br'
+    if 'gzip' in accept_encoding:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    """Flask after_request hook, gzip or brotli for large JSON and HTML."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    data = response.get_data()
+    encoding = _choose_encoding(request.headers.get('Accept-Encoding', '').lower())
+    sent = data
+    if encoding and len(data) >= COMPRESS_MIN_BYTES:
+        if encoding == 'br':
+            sent = brotli.compress(data, quality=5)
+        else:
+            sent = gzip.compress(data, compresslevel=6)
+        response.set_data(sent)
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    transfer_stats.record(request.endpoint or request.path, len(data), len(sent))
+    return response
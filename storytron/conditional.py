@@ -0,0 +1,91 @@
+import os
+import time
+import hashlib
+import functools
+from datetime import datetime, timezone
+
+from flask import request, make_response
+
+from compression import transfer_stats
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_version(path):
+    """(mtime_ns, size) of a file from a single stat, the file itself is not read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (0, 0)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def dir_version(path, suffix='.txt'):
+    """Newest mtime, count and total size of the matching files in a directory."""
+    newest, count, size = 0, 0, 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.name.endswith(suffix):
+                    st = entry.stat()
+                    newest = max(newest, st.st_mtime_ns)
+                    count += 1
+                    size += st.st_size
+    except OSError:
+        pass
+    return (newest, count, size)
+
+
+def code_version():
+    """Same in every server process running the same code and templates, changes with a deploy."""
+    versions = (dir_version(APP_DIR, '.py'), dir_version(os.path.join(APP_DIR, 'agents'), '.py'),
+                dir_version(os.path.join(APP_DIR, 'templates'), '.html'))
+    return os.environ.get('STORYTRON_CODE_VERSION') or hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()[:12]
+
+
+# Templates and code only change with a restart
+CODE_VERSION = code_version()
+
+
+def versioned(*sources):
+    """Answer If-None-Match / If-Modified-Since with 304 before the view runs."""
+    # Each source returns a version tuple starting with an mtime in nanoseconds, 0 when unknown
+    def decorator(view):
+        @functools.wraps(view)
+        def tag(kwargs, versions):
+            payload = repr((CODE_VERSION, request.endpoint, sorted(kwargs.items()), versions))
+            etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()[:20]
+            newest = max((v[0] for v in versions), default=0)
+            # Last-Modified has one second resolution, only advertise it once that second is over
+            last_modified = None
+            if newest and newest < time.time_ns() // 10**9 * 10**9:
+                last_modified = datetime.fromtimestamp(newest // 10**9, timezone.utc)
+            return etag, last_modified
+
+        def wrapped(*args, **kwargs):
+            versions = [source() for source in sources]
+            etag, last_modified = tag(kwargs, versions)
+
+            if request.if_none_match:
+                fresh = request.if_none_match.contains_weak(etag)
+            else:
+                fresh = (last_modified is not None and request.if_modified_since is not None
+                         and last_modified <= request.if_modified_since)
+            if fresh:
+                transfer_stats.record_not_modified(request.endpoint)
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if any(v[0] == 0 for v in versions):
+                    # The view created a missing file, e.g. the state of a new session, tag what exists now
+                    etag, last_modified = tag(kwargs, [source() for source in sources])
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            # Let browsers reuse the copy only after revalidating
+            response.cache_control.no_cache = True
+            return response
+        return wrapped
+    return decorator
@@ -0,0 +1,94 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+IDEMPOTENCY_TTL = float(os.environ.get('STORYTRON_IDEMPOTENCY_TTL', '900'))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('STORYTRON_IDEMPOTENCY_MAX_KEYS', '1000'))
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request body."""
+
+
+class _Entry:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+
+
+class IdempotencyCache:
+    """Bounded TTL map from idempotency key to an in-flight or finished response."""
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_keys=IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.generated = 0
+        self.replayed = 0
+        self.joined = 0
+
+    @staticmethod
+    def fingerprint(payload):
+        return hashlib.sha256(repr(payload).encode('utf-8')).hexdigest()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            expired = now - entry.created >= self.ttl
+            # Runs before an insert, leave room for the new key
+            full = len(self._entries) >= self.max_keys
+            # A request that is still running stays until its TTL so a retry can join it
+            if not expired and not (full and entry.done.is_set()):
+                break
+            self._entries.popitem(last=False)
+
+    def begin(self, key, payload):
+        """Returns (entry, owner), the owner computes the response and calls finish() or abandon()."""
+        fingerprint = self.fingerprint(payload)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    raise IdempotencyConflict(key)
+                if entry.done.is_set():
+                    self.replayed += 1
+                else:
+                    self.joined += 1
+                return entry, False
+            entry = _Entry(fingerprint)
+            self._entries[key] = entry
+            self.generated += 1
+            return entry, True
+
+    def finish(self, entry, result):
+        entry.result = result
+        entry.done.set()
+
+    def abandon(self, key, entry):
+        """Forget a failed computation so the next retry runs it again."""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def wait(self, entry, timeout):
+        """Result of the owning request, None if it is still running or failed."""
+        entry.done.wait(timeout)
+        return entry.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'keys': len(self._entries),
+                'generated': self.generated,
+                'replayed': self.replayed,
+                'joined': self.joined,
+                'duplicates_avoided': self.replayed + self.joined,
+            }
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import tempfile
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DIR = os.environ.get('STORYTRON_JOBS_DIR', 'chat_jobs')
+JOB_WORKERS = int(os.environ.get('STORYTRON_CHAT_WORKERS', '2'))
+# Finished jobs are kept on disk this long for late pollers
+JOB_TTL = float(os.environ.get('STORYTRON_JOB_TTL', '3600'))
+
+PENDING = ('queued', 'running')
+
+
+class ChatJobs:
+    """Chat turns run on a bounded worker pool, every state change is persisted."""
+
+    def __init__(self, run_turn, directory=JOBS_DIR, workers=JOB_WORKERS, ttl=JOB_TTL, stream=None):
+        self.run_turn = run_turn
+        # stream(callback) is a context manager that feeds reply pieces of the running turn to callback
+        self.stream = stream
+        self.directory = directory
+        self.ttl = ttl
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._keys = {}
+        # Reply text streamed so far by running jobs, only kept in memory
+        self._partials = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        """Start the worker pool in this process and recover jobs left by a restart."""
+        # A preforking server imports the app in its parent, jobs only ever run in the workers
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='chat-job')
+            self._pid = os.getpid()
+            self._recover()
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _store(self, job):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(job['id']))
+
+    def _load(self, job_id):
+        try:
+            with open(self._path(job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _lock_path(self, job_id):
+        return os.path.join(self.directory, f'{job_id}.lock')
+
+    def _recover(self):
+        """Keep finished results, run jobs that never started and fail jobs a restart interrupted."""
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            job = self._load(name[:-5])
+            if job is None:
+                continue
+            self._jobs[job['id']] = job
+            if job.get('key'):
+                self._keys[job['key']] = job['id']
+            if job['status'] == 'queued':
+                self._executor.submit(self._run, job['id'])
+            elif job['status'] == 'running':
+                self._fail_interrupted(job['id'])
+        self._expire()
+
+    def _fail_interrupted(self, job_id):
+        # The turn may already have advanced the story and written history, running it again would repeat it
+        with open(self._lock_path(job_id), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Still running in another server process
+                self._jobs.pop(job_id, None)
+                return
+            self._update(job_id, status='failed', error='Interrupted by a server restart', finished=time.time())
+
+    def submit(self, data, key=None):
+        """Returns (job, created), a known idempotency key returns the existing job."""
+        self.start()
+        with self._cond:
+            job_id = self._keys.get(key)
+            # Jobs run by another server process are only followed on disk
+            existing = self._jobs.get(job_id) or (self._load(job_id) if job_id else None)
+            # A failed job is retried under the same key, anything else is returned as is
+            if existing and existing['status'] != 'failed':
+                return existing, False
+            job = {'id': uuid.uuid4().hex, 'key': key, 'status': 'queued', 'request': data,
+                   'created': time.time(), 'result': None, 'error': None}
+            self._store(job)
+            self._jobs[job['id']] = job
+            if key:
+                self._keys[key] = job['id']
+        self._executor.submit(self._run, job['id'])
+        self._expire()
+        return job, True
+
+    def _update(self, job_id, **fields):
+        with self._cond:
+            job = dict(self._jobs[job_id], **fields)
+            # Persist before anyone can observe the new state
+            self._store(job)
+            self._jobs[job_id] = job
+            self._cond.notify_all()
+
+    def _run(self, job_id):
+        # Several server processes may recover the same job, only the one holding the lock runs it
+        with open(self._lock_path(job_id), 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Another process owns it, get() and submit() follow the job file instead
+                with self._cond:
+                    self._jobs.pop(job_id, None)
+                return
+            stored = self._load(job_id)
+            if stored and stored['status'] not in PENDING:
+                with self._cond:
+                    self._jobs[job_id] = stored
+                    self._cond.notify_all()
+                return
+
+            self._update(job_id, status='running', started=time.time())
+            try:
+                with self.stream(lambda piece: self._append_partial(job_id, piece)) if self.stream else nullcontext():
+                    result = self.run_turn(self._jobs[job_id]['request'])
+            except Exception as e:
+                self._update(job_id, status='failed', error=str(e), finished=time.time())
+            else:
+                self._update(job_id, status='done', result=result, finished=time.time())
+            finally:
+                with self._cond:
+                    self._partials.pop(job_id, None)
+
+    def _append_partial(self, job_id, piece):
+        with self._cond:
+            self._partials[job_id] = self._partials.get(job_id, '') + piece
+            self._cond.notify_all()
+
+    def get(self, job_id, wait=0):
+        """Job dict or None, waits up to `wait` seconds for a pending job to finish."""
+        self.start()
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                # Jobs submitted through another process are only visible on disk
+                job = self._jobs.get(job_id) or self._load(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job['status'] not in PENDING or remaining <= 0:
+                    return job
+                self._cond.wait(remaining if job_id in self._jobs else min(remaining, 0.5))
+
+    def follow(self, job_id, status, offset, wait):
+        """(job, streamed text) once the status differs from `status` or more than `offset` characters streamed."""
+        self.start()
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                job = self._jobs.get(job_id) or self._load(job_id)
+                text = self._partials.get(job_id, '')
+                remaining = deadline - time.monotonic()
+                if job is None or job['status'] != status or len(text) > offset or remaining <= 0:
+                    return job, text
+                self._cond.wait(remaining if job_id in self._jobs else min(remaining, 0.5))
+
+    def _expire(self):
+        now = time.time()
+        with self._cond:
+            stale = [job_id for job_id, job in self._jobs.items()
+                     if job['status'] not in PENDING and now - job['finished'] > self.ttl]
+            # Keys of jobs followed on disk go once another process expired the file
+            stale_keys = [key for key, job_id in self._keys.items()
+                          if job_id not in self._jobs and not os.path.exists(self._path(job_id))]
+            for key in stale_keys:
+                del self._keys[key]
+            for job_id in stale:
+                job = self._jobs.pop(job_id)
+                self._keys.pop(job.get('key'), None)
+                for path in (self._path(job_id), self._lock_path(job_id)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        self.start()
+        with self._cond:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+    def shutdown(self, wait=False):
+        if self._pid == os.getpid():
+            self._executor.shutdown(wait=wait)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    from llama_cpp import Llama
+except ImportError:
+    Llama = None
+
+from usage import usage_record
+
+# GGUF model file, empty disables the local backend
+LOCAL_MODEL = os.environ.get('STORYTRON_LOCAL_MODEL', '')
+# Agent ids that always use the local model, "all" for every agent
+LOCAL_AGENTS = os.environ.get('STORYTRON_LOCAL_AGENTS', '')
+LOCAL_CONTEXT = int(os.environ.get('STORYTRON_LOCAL_CONTEXT', '2048'))
+LOCAL_MAX_TOKENS = int(os.environ.get('STORYTRON_LOCAL_MAX_TOKENS', '200'))
+LOCAL_THREADS = int(os.environ.get('STORYTRON_LOCAL_THREADS', str(os.cpu_count() or 4)))
+# Remote timeout once a local fallback exists, and how long to stay local after the remote failed
+FALLBACK_AFTER = float(os.environ.get('STORYTRON_LOCAL_FALLBACK_AFTER', '20'))
+FALLBACK_COOLDOWN = float(os.environ.get('STORYTRON_LOCAL_COOLDOWN', '60'))
+
+
+# Callback per thread that receives reply pieces as the local model generates them
+_sink = threading.local()
+
+
+@contextmanager
+def stream_to(callback):
+    """Pass the pieces of local model replies generated by this thread to callback(text)."""
+    previous = getattr(_sink, 'callback', None)
+    _sink.callback = callback
+    try:
+        yield
+    finally:
+        _sink.callback = previous
+
+
+class LocalResponse:
+    """Just enough of a Responses API result for the agents."""
+
+    def __init__(self, output_text):
+        self.output_text = output_text
+
+
+class LocalModel:
+    """Quantized model run on the CPU through llama.cpp, loaded on first use."""
+
+    def __init__(self, path=LOCAL_MODEL, n_ctx=LOCAL_CONTEXT, max_tokens=LOCAL_MAX_TOKENS, threads=LOCAL_THREADS):
+        self.path = path
+        self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+        self.threads = threads
+        self.name = f'local:{os.path.basename(path)}'
+        self._llama = None
+        # One llama context, generations take turns
+        self._lock = threading.Lock()
+        self._remote_failed_at = None
+        self.generations = 0
+        self.fallbacks = 0
+        self._rates = deque(maxlen=50)
+        self._first_token = deque(maxlen=50)
+
+    @property
+    def available(self):
+        return bool(self.path) and Llama is not None and os.path.exists(self.path)
+
+    def _model(self):
+        if self._llama is None:
+            self._llama = Llama(model_path=self.path, n_ctx=self.n_ctx, n_threads=self.threads, verbose=False)
+        return self._llama
+
+    # Chat template tokens around each message
+    MESSAGE_OVERHEAD = 8
+
+    def _fit(self, llama, messages):
+        """Keep the system prompt and the newest messages that fit next to the reply, cutting what alone is too long."""
+        budget = self.n_ctx - self.max_tokens
+        count = lambda m: len(llama.tokenize(m['content'].encode('utf-8'), add_bos=False)) + self.MESSAGE_OVERHEAD
+        head = messages[:1] if messages and messages[0]['role'] == 'system' else []
+        rest = messages[len(head):]
+        if head:
+            # The newest message needs room next to the system prompt
+            head = [self._truncate(llama, head[0], budget // 2 if rest else budget, keep_end=False)]
+        used = sum(count(m) for m in head)
+        tail = []
+        for message in reversed(rest):
+            cost = count(message)
+            if used + cost > budget:
+                if not tail:
+                    tail.insert(0, self._truncate(llama, message, budget - used, keep_end=True))
+                break
+            used += cost
+            tail.insert(0, message)
+        return head + tail
+
+    def _truncate(self, llama, message, limit, keep_end):
+        """Message cut to `limit` tokens, keeping its start or its end."""
+        tokens = llama.tokenize(message['content'].encode('utf-8'), add_bos=False)
+        room = max(limit - self.MESSAGE_OVERHEAD, 1)
+        if len(tokens) <= room:
+            return message
+        kept = tokens[-room:] if keep_end else tokens[:room]
+        return dict(message, content=llama.detokenize(kept).decode('utf-8', errors='ignore'))
+
+    def stream(self, messages, counts=None):
+        """Yield the reply piece by piece, records tokens/s and time to first token."""
+        with self._lock:
+            llama = self._model()
+            messages = self._fit(llama, messages)
+            started = time.perf_counter()
+            first = None
+            tokens = 0
+            for chunk in llama.create_chat_completion(messages=messages, max_tokens=self.max_tokens, stream=True):
+                piece = chunk['choices'][0]['delta'].get('content')
+                if not piece:
+                    continue
+                if first is None:
+                    first = time.perf_counter() - started
+                # llama.cpp streams one token per chunk
+                tokens += 1
+                yield piece
+            elapsed = time.perf_counter() - started
+            self.generations += 1
+            if first is not None:
+                self._first_token.append(first)
+            if tokens > 1 and elapsed > first:
+                self._rates.append((tokens - 1) / (elapsed - first))
+            if counts is not None:
+                counts['input_tokens'] = sum(len(llama.tokenize(m['content'].encode('utf-8'), add_bos=False))
+                                             for m in messages)
+                counts['output_tokens'] = tokens
+
+    def complete(self, messages):
+        """Whole reply as (response, usage), pieces also go to the callback set by stream_to()."""
+        started = time.perf_counter()
+        counts = {}
+        callback = getattr(_sink, 'callback', None)
+        pieces = []
+        for piece in self.stream(messages, counts):
+            pieces.append(piece)
+            if callback is not None:
+                callback(piece)
+        text = ''.join(pieces).strip()
+        usage = usage_record(self.name, counts['input_tokens'], counts['output_tokens'], time.perf_counter() - started)
+        return LocalResponse(text), usage
+
+    def use_for(self, agent_id):
+        """True when the agent is pinned to the local model or the remote failed recently."""
+        if not self.available:
+            return False
+        pinned = LOCAL_AGENTS == 'all' or agent_id in LOCAL_AGENTS.split(',')
+        recent_failure = self._remote_failed_at is not None and \
+            time.monotonic() - self._remote_failed_at < FALLBACK_COOLDOWN
+        return pinned or recent_failure
+
+    def remote_failed(self):
+        self._remote_failed_at = time.monotonic()
+        self.fallbacks += 1
+
+    def stats(self):
+        rates = sorted(self._rates)
+        first = sorted(self._first_token)
+        return {
+            'model': self.name if self.path else None,
+            'available': self.available,
+            'loaded': self._llama is not None,
+            'generations': self.generations,
+            'fallbacks': self.fallbacks,
+            'tokens_per_s': sum(rates) / len(rates) if rates else None,
+            'first_token_ms': 1000 * sum(first) / len(first) if first else None,
+        }
+
+
+local_model = LocalModel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure local model speed with an agent prompt')
+    parser.add_argument('--model', default=LOCAL_MODEL, help='GGUF model file')
+    parser.add_argument('--agent', default='start', help='agent whose prompt from prompts/ is the system prompt')
+    parser.add_argument('--message', default='Ahoj, kdo jsi?')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    from agents.prompt_loader import load_prompt
+    model = LocalModel(args.model)
+    if not model.available:
+        sys.exit("llama-cpp-python is not installed or the model file does not exist")
+    messages = [{"role": "system", "content": load_prompt(args.agent)}, {"role": "user", "content": args.message}]
+    for run in range(args.runs):
+        for piece in model.stream(messages):
+            if run == 0:
+                print(piece, end='', flush=True)
+        if run == 0:
+            print()
+    st = model.stats()
+    if st['tokens_per_s'] is None:
+        sys.exit("the model produced no tokens")
+    print(f"{st['model']}: {st['tokens_per_s']:.1f} tokens/s, first token {st['first_token_ms']:.0f} ms "
+          f"over {st['generations']} runs ({model.threads} threads, n_ctx {model.n_ctx})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import json
+import tempfile
+import threading
+
+# Events after the last snapshot before the log is compacted into a new snapshot
+COMPACT_EVENTS = int(os.environ.get('STORYTRON_MEMORY_COMPACT_EVENTS', '100'))
+
+
+class WriteStats:
+    """Bytes written for story state and agent memory, to follow the write amplification per turn."""
+
+    FIELDS = ('turns', 'state_writes', 'state_bytes', 'events', 'log_bytes', 'snapshots', 'snapshot_bytes',
+              'loads', 'replayed_events', 'replay_ms')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **counts):
+        with self._lock:
+            for field, value in counts.items():
+                self._counts[field] += value
+
+    def snapshot(self):
+        with self._lock:
+            result = dict(self._counts)
+        written = result['state_bytes'] + result['log_bytes'] + result['snapshot_bytes']
+        result['bytes_per_turn'] = written / result['turns'] if result['turns'] else None
+        result['replay_ms_per_load'] = result['replay_ms'] / result['loads'] if result['loads'] else None
+        return result
+
+
+write_stats = WriteStats()
+
+
+class MemoryLog:
+    """Append-only log of one agent's memory exchanges on top of its last snapshot."""
+
+    def __init__(self, directory, agent_id, compact_events=COMPACT_EVENTS):
+        self.directory = directory
+        self.log_path = os.path.join(directory, f'{agent_id}.jsonl')
+        self.snapshot_path = os.path.join(directory, f'{agent_id}.snapshot.json')
+        self.compact_events = compact_events
+        self.seq = 0
+        self.pending = 0
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.log_path)
+
+    def replay(self, memory):
+        """Rebuild the memory deque from the snapshot and the events after it, returns the events replayed."""
+        snapshot = {'seq': 0, 'exchanges': []}
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            pass
+        memory.clear()
+        memory.extend(snapshot['exchanges'])
+        self.seq = snapshot['seq']
+        replayed = 0
+        try:
+            with open(self.log_path, 'rb+') as f:
+                valid_end = 0
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A crash mid-append leaves a torn last line, cut it so new events start on a clean line
+                        f.truncate(valid_end)
+                        break
+                    valid_end += len(line)
+                    # Events already folded into the snapshot when compaction was interrupted
+                    if event['seq'] <= self.seq:
+                        continue
+                    memory.append(event['exchange'])
+                    self.seq = event['seq']
+                    replayed += 1
+        except OSError:
+            pass
+        self.pending = replayed
+        return replayed
+
+    def append(self, exchange, memory):
+        self.seq += 1
+        line = json.dumps({'seq': self.seq, 'exchange': exchange}, ensure_ascii=False) + '\n'
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        write_stats.add(events=1, log_bytes=len(line.encode('utf-8')))
+        self.pending += 1
+        if self.pending >= self.compact_events:
+            self.compact(memory)
+
+    def compact(self, memory):
+        """Write the whole memory as the new snapshot and start an empty log."""
+        data = json.dumps({'seq': self.seq, 'exchanges': list(memory)}, ensure_ascii=False)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.snapshot_path)
+        # Truncating only after the snapshot is in place, replay skips events it already holds
+        open(self.log_path, 'w').close()
+        self.pending = 0
+        write_stats.add(snapshots=1, snapshot_bytes=len(data.encode('utf-8')))
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import random
+import hashlib
+import threading
+from datetime import datetime
+
+from flask import request, g
+
+# Share of requests logged, chat turns and everything else separately, errors are always logged
+LOG_SAMPLE_CHAT = float(os.environ.get('STORYTRON_LOG_SAMPLE', '1'))
+LOG_SAMPLE_OTHER = float(os.environ.get('STORYTRON_LOG_SAMPLE_OTHER', '0'))
+# How player messages and replies appear in the log: truncate, hash or drop
+LOG_REDACT = os.environ.get('STORYTRON_LOG_REDACT', 'truncate')
+LOG_TEXT_CHARS = 100
+LOG_FILE = os.environ.get('STORYTRON_LOG_FILE', '')
+LOG_QUEUE_SIZE = int(os.environ.get('STORYTRON_LOG_QUEUE', '1000'))
+
+
+def redact(text, mode=LOG_REDACT):
+    if text is None or mode == 'none':
+        return text
+    if mode == 'drop':
+        return None
+    if mode == 'hash':
+        return f"sha256:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]} len:{len(text)}"
+    return text.replace('\n', ' ')[:LOG_TEXT_CHARS]
+
+
+def log_fields(**fields):
+    """Attach fields a view already has at hand to the request's log record."""
+    g.setdefault('log_fields', {}).update(fields)
+
+
+class RequestLogger:
+    """JSON lines request log, records are written by a background thread."""
+
+    TEXT_FIELDS = ('message', 'reply')
+
+    def __init__(self, path=LOG_FILE, sample_chat=LOG_SAMPLE_CHAT, sample_other=LOG_SAMPLE_OTHER,
+                 redact_mode=LOG_REDACT, queue_size=LOG_QUEUE_SIZE):
+        self.path = path
+        self.sample_chat = sample_chat
+        self.sample_other = sample_other
+        self.redact_mode = redact_mode
+        self.queue_size = queue_size
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        atexit.register(self.flush)
+
+    def _ensure_writer(self):
+        # Forked server workers do not inherit the parent's writer thread
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                threading.Thread(target=self._run, args=(self._queue,), name='request-log', daemon=True).start()
+                self._pid = os.getpid()
+
+    def init_app(self, app):
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex[:16]
+        g.request_started = time.perf_counter()
+
+    def finish(self, response):
+        request_id = g.get('request_id')
+        if request_id is None:
+            return response
+        response.headers['X-Request-Id'] = request_id
+        rate = self.sample_chat if request.path.startswith('/api/chat') else self.sample_other
+        if response.status_code < 400 and random.random() >= rate:
+            self.sampled_out += 1
+            return response
+
+        record = {
+            'ts': datetime.now().isoformat(),
+            'request_id': request_id,
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round(1000 * (time.perf_counter() - g.request_started), 1),
+            'request_bytes': request.content_length,
+            # Streamed responses have no length yet
+            'response_bytes': response.content_length,
+        }
+        record.update(g.get('log_fields', {}))
+        for field in self.TEXT_FIELDS:
+            if field in record:
+                record[field] = redact(record[field], self.redact_mode)
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            # Losing a log line beats making the player wait for the disk
+            self.dropped += 1
+        return response
+
+    def _run(self, records):
+        out = open(self.path, 'a', encoding='utf-8') if self.path else sys.stdout
+        while True:
+            record = records.get()
+            try:
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                if records.empty():
+                    out.flush()
+                self.written += 1
+            except Exception as e:
+                print(f"Request log error: {e}", file=sys.stderr)
+            finally:
+                records.task_done()
+
+    def flush(self):
+        """Block until every queued record is written."""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._pid == os.getpid() else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+            'sampled_out': self.sampled_out,
+            'sample_chat': self.sample_chat,
+            'sample_other': self.sample_other,
+            'redact': self.redact_mode,
+        }
@@ -2,14 +2,62 @@
 """
 StoryTRON Flask Application Runner
 """
+import os
 import argparse
+import app as storytron_app
 from app import app
 
+
+def serve_production(args):
+    """Serve through gunicorn, kill -HUP on the master replaces the workers gracefully."""
+    from gunicorn.app.base import BaseApplication
+
+    # Warm caches in the master so every forked worker starts with them
+    storytron_app.preload()
+
+    options = {
+        'bind': f"{app.config['HOST']}:{app.config['PORT']}",
+        'workers': args.workers,
+        'worker_class': args.worker_class,
+        # gunicorn silently turns sync into gthread when threads > 1
+        'threads': args.threads if args.worker_class == 'gthread' else 1,
+        'preload_app': True,
+        # Long-polls hold a request for up to 50 s and a synchronous chat turn can take longer
+        'timeout': args.timeout,
+        'graceful_timeout': args.timeout,
+        'keepalive': 75,
+        'post_worker_init': lambda worker: storytron_app.chat_jobs.start(),
+        # Runs in a worker that is stopping, including the old workers after a HUP
+        'worker_exit': lambda server, worker: storytron_app.flush_pending(),
+    }
+
+    class StorytronServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    StorytronServer().run()
+
+
 if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Run the StoryTRON Flask application')
     parser.add_argument('--debug', action='store_true',
                        help='Run in debug mode with auto-reload')
+    parser.add_argument('--production', action='store_true',
+                       help='Serve with gunicorn instead of the Flask development server')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('STORYTRON_WORKERS', '1')),
+                       help='Worker processes (production)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('STORYTRON_THREADS', '8')),
+                       help='Threads per worker process (production, gthread)')
+    parser.add_argument('--worker-class', choices=['gthread', 'sync'],
+                       default=os.environ.get('STORYTRON_WORKER_CLASS', 'gthread'),
+                       help='Gunicorn worker model (production)')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('STORYTRON_WORKER_TIMEOUT', '120')),
+                       help='Seconds before a stuck worker is restarted (production)')
     args = parser.parse_args()
 
     print(f"Starting StoryTRON on {app.config['HOST']}:{app.config['PORT']}")
@@ -22,8 +70,16 @@ if __name__ == '__main__':
     else:
         print("OpenAI API Key: NOT SET!")
 
-    app.run(
-        host=app.config['HOST'],
-        port=app.config['PORT'],
-        debug=args.debug
-    )
+    if args.production:
+        print(f"Production mode: {args.workers} x {args.worker_class} workers"
+              + (f", {args.threads} threads each" if args.worker_class == 'gthread' else ""))
+        serve_production(args)
+    else:
+        # With --debug only the reloader's child serves requests
+        if not args.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            storytron_app.chat_jobs.start()
+        app.run(
+            host=app.config['HOST'],
+            port=app.config['PORT'],
+            debug=args.debug
+        )
@@ -0,0 +1,168 @@
+import os
+import re
+import time
+import fcntl
+import shutil
+import threading
+from contextlib import contextmanager
+
+from story import STATE_FILE, DEFAULT_STATE_FILE
+from conditional import file_version
+
+SESSIONS_DIR = os.environ.get('STORYTRON_SESSIONS_DIR', 'sessions')
+DEFAULT_SESSION = 'default'
+# Sessions whose story stays loaded in memory, the least recently used ones are dropped first
+HOT_SESSIONS = int(os.environ.get('STORYTRON_HOT_SESSIONS', '8'))
+SESSION_IDLE = float(os.environ.get('STORYTRON_SESSION_IDLE', '1800'))
+
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class Session:
+    """One game with its own state file, history file and turn lock."""
+
+    def __init__(self, session_id, state_file, history_file):
+        self.id = session_id
+        self.state_file = state_file
+        self.history_file = history_file
+        self.lock = threading.RLock()
+        # Nesting depth of use() in the thread holding lock, the file lock is only taken by the outermost one
+        self.depth = 0
+        self._lock_file = None
+        self.story = None
+        self.version = None
+        self.last_used = time.monotonic()
+
+
+class SessionStore:
+    """Loaded stories of recently used sessions, idle ones only live in their state file."""
+
+    def __init__(self, build_story, history_file, directory=SESSIONS_DIR, hot=HOT_SESSIONS, idle=SESSION_IDLE):
+        self.build_story = build_story
+        self.history_file = history_file
+        self.directory = directory
+        self.hot = hot
+        self.idle = idle
+        self._lock = threading.Lock()
+        # Session objects are never dropped so everybody shares the same lock per id
+        self._sessions = {}
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def valid(session_id):
+        return bool(SESSION_ID_RE.match(session_id or ''))
+
+    def paths(self, session_id):
+        # The default session keeps the original files so existing deployments continue their game
+        if session_id == DEFAULT_SESSION:
+            return STATE_FILE, self.history_file
+        directory = os.path.join(self.directory, session_id)
+        return os.path.join(directory, 'story_state.json'), os.path.join(directory, 'message_history.jsonl')
+
+    def get(self, session_id):
+        """Session object for an id, nothing is loaded."""
+        if not self.valid(session_id):
+            raise ValueError(f'Invalid session id: {session_id!r}')
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id, *self.paths(session_id))
+                self._sessions[session_id] = session
+            return session
+
+    def _load(self, session):
+        version = file_version(session.state_file)
+        # Another server process may have advanced the game since it was loaded
+        if session.story is not None and version == session.version:
+            self.hits += 1
+            return
+        if not os.path.exists(session.state_file) and os.path.exists(DEFAULT_STATE_FILE):
+            os.makedirs(os.path.dirname(session.state_file) or '.', exist_ok=True)
+            shutil.copy(DEFAULT_STATE_FILE, session.state_file)
+        story = self.build_story(session.id, session.state_file)
+        story.load_state()
+        if session.story is not None:
+            session.story.close()
+        session.story = story
+        session.version = file_version(session.state_file)
+        self.loads += 1
+
+    @contextmanager
+    def use(self, session_id):
+        """Session with its story loaded, turns of one session run one at a time, also across server processes."""
+        session = self.get(session_id)
+        with session.lock:
+            if session.depth == 0:
+                self._lock_process(session)
+            session.depth += 1
+            try:
+                session.last_used = time.monotonic()
+                self._load(session)
+                yield session
+            finally:
+                session.version = file_version(session.state_file)
+                session.depth -= 1
+                if session.depth == 0:
+                    self._unlock_process(session)
+        self._evict()
+
+    @staticmethod
+    def _lock_process(session):
+        # The RLock only serializes threads, a flock keeps other worker processes out of the same game
+        os.makedirs(os.path.dirname(session.state_file) or '.', exist_ok=True)
+        session._lock_file = open(f'{session.state_file}.lock', 'w')
+        fcntl.flock(session._lock_file, fcntl.LOCK_EX)
+
+    @staticmethod
+    def _unlock_process(session):
+        try:
+            fcntl.flock(session._lock_file, fcntl.LOCK_UN)
+        finally:
+            session._lock_file.close()
+            session._lock_file = None
+
+    def _evict(self):
+        now = time.monotonic()
+        with self._lock:
+            loaded = sorted((s for s in self._sessions.values() if s.story is not None), key=lambda s: s.last_used)
+        excess = len(loaded) - self.hot
+        for session in loaded:
+            if excess <= 0 and now - session.last_used < self.idle:
+                break
+            # A session in the middle of a turn is skipped, the next use evicts it
+            if not session.lock.acquire(blocking=False):
+                continue
+            try:
+                # State is written on every change, dropping the story loses nothing
+                session.story.close()
+                session.story = None
+                session.version = None
+                self.evictions += 1
+            finally:
+                session.lock.release()
+            excess -= 1
+
+    def known(self):
+        """Ids of every session with state on disk or in memory."""
+        ids = {DEFAULT_SESSION}
+        try:
+            ids.update(name for name in os.listdir(self.directory)
+                       if self.valid(name) and os.path.isdir(os.path.join(self.directory, name)))
+        except OSError:
+            pass
+        with self._lock:
+            ids.update(self._sessions)
+        return sorted(ids)
+
+    def stats(self):
+        with self._lock:
+            hot = [s.id for s in self._sessions.values() if s.story is not None]
+        return {
+            'hot': sorted(hot),
+            'known': len(self.known()),
+            'loads': self.loads,
+            'hits': self.hits,
+            'evictions': self.evictions,
+        }
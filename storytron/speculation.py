@@ -0,0 +1,131 @@
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.prompt_loader import load_prompt, load_opening
+
+SPECULATE = os.environ.get('STORYTRON_SPECULATE', '0') == '1'
+SPECULATE_WORKERS = int(os.environ.get('STORYTRON_SPECULATE_WORKERS', '2'))
+# Opening lines older than this are stale and not served
+OPENING_TTL = float(os.environ.get('STORYTRON_OPENING_TTL', '1800'))
+
+# The opening line answers a greeting, any other first message gets a normal turn
+GREETINGS = ('ahoj', 'ahojky', 'čau', 'cau', 'čauky', 'cauky', 'čus', 'cus', 'nazdar', 'zdar', 'zdravím', 'zdravim', 'dobrý den', 'dobry den',
+             'dobrý večer', 'dobry vecer', 'dobré ráno', 'dobre rano', 'servus', 'hej', 'haló', 'halo',
+             'hello', 'hi', 'hey')
+
+
+def is_greeting(message):
+    words = re.sub(r'[^\w\s]', ' ', message.lower()).split()
+    text = ' '.join(words)
+    return not words or (len(words) <= 4 and any(text == g or text.startswith(g + ' ') for g in GREETINGS))
+
+
+class Speculator:
+    """Warms up agents when they become active and pre-generates their opening line."""
+
+    def __init__(self, workers=SPECULATE_WORKERS, ttl=OPENING_TTL):
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speculate')
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.wasted = 0
+        self.wasted_tokens = 0
+        self.saved_ms = 0
+
+    def warm(self, agent):
+        """Start warming an agent that just became active."""
+        previous = getattr(agent, 'opening', None)
+        if previous is not None:
+            # An opening still being generated or fresh from an earlier activation is reused
+            if not previous.done():
+                return
+            opening = self._result(previous)
+            if opening is not None and time.monotonic() - opening['created'] <= self.ttl:
+                return
+            self._waste(opening)
+        with self._lock:
+            self.started += 1
+        agent.opening = self._executor.submit(self._generate, agent)
+
+    def _generate(self, agent):
+        load_prompt(agent.agent_id, agent.satisfied)
+        client = getattr(agent, 'client', None)
+        if client is None:
+            return None
+        instruction = load_opening(agent.agent_id)
+        if instruction is None:
+            # Nothing to say first, only open the connection of the agent's client
+            client.models.retrieve(agent.model)
+            return None
+        response, usage = agent.call_model(agent.conversation_history + [{"role": "user", "content": instruction}])
+        return {'text': response.output_text.strip(), 'usage': usage, 'created': time.monotonic()}
+
+    def take(self, agent, message):
+        """Opening line to serve for the first message to an agent, None to run a normal turn."""
+        future = getattr(agent, 'opening', None)
+        if future is None:
+            return None
+        if not is_greeting(message):
+            self.drop(agent)
+            return None
+        agent.opening = None
+        if not future.done():
+            with self._lock:
+                self.misses += 1
+            self._discard(future)
+            return None
+        opening = self._result(future)
+        if opening is None:
+            return None
+        if time.monotonic() - opening['created'] > self.ttl:
+            self._waste(opening)
+            return None
+        with self._lock:
+            self.hits += 1
+            self.saved_ms += opening['usage']['latency_ms']
+        return opening
+
+    @staticmethod
+    def _result(future):
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Speculative warm-up failed: {e}")
+            return None
+
+    def drop(self, agent):
+        """Give up the agent's opening line, it counts as wasted once generated."""
+        future = getattr(agent, 'opening', None)
+        if future is None:
+            return
+        agent.opening = None
+        self._discard(future)
+
+    def _discard(self, future):
+        """Count an opening line that will never be served once it is generated."""
+        future.add_done_callback(lambda f: self._waste(self._result(f)))
+
+    def _waste(self, opening):
+        if opening is None:
+            return
+        with self._lock:
+            self.wasted += 1
+            self.wasted_tokens += opening['usage']['input_tokens'] + opening['usage']['output_tokens']
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.misses + self.wasted
+            return {
+                'started': self.started,
+                'hits': self.hits,
+                'misses': self.misses,
+                'wasted': self.wasted,
+                'wasted_tokens': self.wasted_tokens,
+                'saved_ms': self.saved_ms,
+                'hit_rate': self.hits / served if served else None,
+            }
@@ -1,5 +1,5 @@
-import json, os
-from agents.prompt_loader import load_prompt
+import json, os, time, tempfile
+from memory_log import MemoryLog, write_stats
 
 STATE_FILE = os.environ.get('STORY_STATE_FILE', 'story_state.json')
 DEFAULT_STATE_FILE = os.environ.get('DEFAULT_STORY_STATE_FILE', 'default_story_state.json')
@@ -7,11 +7,20 @@ DEFAULT_STATE_FILE = os.environ.get('DEFAULT_STORY_STATE_FILE', 'default_story_s
 
 class Story:
 
-    def __init__(self, agents):
+    def __init__(self, agents, state_file=STATE_FILE):
         if not agents:
             raise ValueError("At least one agent required")
         self._agents = {a.agent_id: a for a in agents}
         self.current_id = agents[0].agent_id
+        self.state_file = state_file
+        self.last_usage = None
+        # Speculator that warms up agents as they become active, None disables it
+        self.speculator = None
+        # Agent memory is an event log per agent next to the state file, which only keeps scalars
+        self.memory_dir = os.path.splitext(state_file)[0] + '_memory'
+        for a in agents:
+            if a.enable_memory:
+                a.memory_log = MemoryLog(self.memory_dir, a.agent_id)
 
     @property
     def agents(self):
@@ -29,15 +38,39 @@ class Story:
             raise KeyError(agent_id)
         self.current_id = agent_id
         self._save_state()
+        self._activated(agent_id)
+
+    def _activated(self, agent_id):
+        if self.speculator is not None:
+            self.speculator.warm(self._agents[agent_id])
 
     def chat(self, message):
-        reply = self.active_agent.chat(message)
+        agent = self.active_agent
+        # Usage of the model call behind this reply, None when the agent answered without one
+        agent.last_usage = None
+        opening = self.speculator.take(agent, message) if self.speculator is not None else None
+        if opening is not None:
+            # A greeting as the first message to a new character gets its pre-generated opening line
+            reply = opening['text']
+            agent.add_to_memory(message, reply)
+            self.last_usage = dict(opening['usage'], speculative=True)
+        else:
+            reply = agent.chat(message)
+            self.last_usage = agent.last_usage
+        write_stats.add(turns=1)
         new_id = self._decide_agent(self.current_id, self._agents, message, reply)
         if new_id in self._agents and new_id != self.current_id:
             self.current_id = new_id
             self._save_state()
+            self._activated(new_id)
         return reply
 
+    def close(self):
+        """Called when the story is dropped from memory, opening lines nobody will take are wasted."""
+        if self.speculator is not None:
+            for agent in self._agents.values():
+                self.speculator.drop(agent)
+
     def reset_story(self):
         """Reset story to default state from default_story_state.json."""
         with open(DEFAULT_STATE_FILE, 'r') as f:
@@ -76,16 +109,11 @@ class Story:
     def _to_state(self):
         agents_state = {}
         for aid, a in self._agents.items():
-            agent_state = {
+            agents_state[aid] = {
                 'satisfied': getattr(a, 'satisfied', False),
                 'tts_engine': getattr(a, 'tts_engine', 'gtts'),
                 'tts_voice': getattr(a, 'tts_voice', 'cs')
             }
-            # Add memory state if agent has memory enabled
-            memory_state = a.get_memory_state()
-            if memory_state:
-                agent_state['memory'] = memory_state
-            agents_state[aid] = agent_state
 
         return {
             'current_id': self.current_id,
@@ -108,23 +136,34 @@ class Story:
                     setattr(self._agents[aid], 'tts_engine', st['tts_engine'])
                 if 'tts_voice' in st:
                     setattr(self._agents[aid], 'tts_voice', st['tts_voice'])
-                # Restore memory state
+                # Memory embedded by state files from before the memory logs
                 if 'memory' in st:
                     self._agents[aid].set_memory_state(st['memory'])
 
-                # Update system prompt for OpenAI agents after satisfaction state is restored
-                agent = self._agents[aid]
-                if (hasattr(agent, 'load_system_prompt') and agent.load_system_prompt and
-                    hasattr(agent, 'conversation_history') and agent.conversation_history and
-                    agent.conversation_history[0]['role'] == 'system'):
-                    system_prompt = load_prompt(agent.agent_id, agent.satisfied)
-                    agent.conversation_history[0]['content'] = system_prompt
-
     def _save_state(self):
-        with open(STATE_FILE, 'w') as f:
-            json.dump(self._to_state(), f, indent=2)
+        data = json.dumps(self._to_state(), indent=2)
+        # Readers in other processes never see a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.state_file) or '.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.state_file)
+        write_stats.add(state_writes=1, state_bytes=len(data.encode('utf-8')))
 
     def load_state(self):
-        with open(STATE_FILE, 'r') as f:
+        with open(self.state_file, 'r') as f:
             data = json.load(f)
         self._apply_state(data)
+        self._load_memory()
+
+    def _load_memory(self):
+        started = time.perf_counter()
+        replayed = 0
+        for a in self._agents.values():
+            if a.memory_log is None:
+                continue
+            if a.memory_log.exists():
+                replayed += a.memory_log.replay(a.conversation_memory)
+            elif a.conversation_memory:
+                # Move memory out of an old state file into the first snapshot
+                a.memory_log.compact(a.conversation_memory)
+        write_stats.add(loads=1, replayed_events=replayed, replay_ms=1000 * (time.perf_counter() - started))
@@ -0,0 +1,68 @@
+import os
+
+from flask import Flask
+
+from conditional import versioned, file_version
+
+
+def make_app(path, calls):
+    app = Flask(__name__)
+
+    @app.route('/state')
+    @versioned(lambda: file_version(path))
+    def state():
+        calls.append(1)
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write('{}')
+        with open(path) as f:
+            return f.read()
+
+    return app
+
+
+def test_matching_etag_answers_304_without_running_the_view(tmp_path):
+    path = str(tmp_path / 'state.json')
+    with open(path, 'w') as f:
+        f.write('{"a": 1}')
+    calls = []
+    client = make_app(path, calls).test_client()
+    first = client.get('/state')
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+    second = client.get('/state', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304 and second.data == b''
+    assert len(calls) == 1
+
+
+def test_changed_file_gets_a_new_etag(tmp_path):
+    path = str(tmp_path / 'state.json')
+    with open(path, 'w') as f:
+        f.write('{"a": 1}')
+    client = make_app(path, []).test_client()
+    etag = client.get('/state').headers['ETag']
+    with open(path, 'w') as f:
+        f.write('{"a": 22}')
+    changed = client.get('/state', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_if_modified_since_answers_304(tmp_path):
+    path = str(tmp_path / 'state.json')
+    with open(path, 'w') as f:
+        f.write('{}')
+    os.utime(path, (1_700_000_000, 1_700_000_000))
+    client = make_app(path, []).test_client()
+    first = client.get('/state')
+    assert first.headers['Last-Modified']
+    second = client.get('/state', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert second.status_code == 304
+
+
+def test_file_created_by_the_view_is_tagged_as_created(tmp_path):
+    path = str(tmp_path / 'state.json')
+    calls = []
+    client = make_app(path, calls).test_client()
+    first = client.get('/state')
+    second = client.get('/state', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+    assert len(calls) == 1
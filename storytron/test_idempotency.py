@@ -0,0 +1,58 @@
+import time
+
+import pytest
+
+from idempotency import IdempotencyCache, IdempotencyConflict
+
+
+def test_retry_joins_and_then_replays():
+    cache = IdempotencyCache()
+    entry, owner = cache.begin('k', {'message': 'ahoj'})
+    assert owner
+    joined, owner = cache.begin('k', {'message': 'ahoj'})
+    assert joined is entry and not owner
+    assert cache.wait(joined, 0) is None
+    cache.finish(entry, {'reply': 'čau'})
+    replayed, owner = cache.begin('k', {'message': 'ahoj'})
+    assert not owner
+    assert cache.wait(replayed, 0) == {'reply': 'čau'}
+    assert cache.stats() == dict(cache.stats(), generated=1, joined=1, replayed=1, duplicates_avoided=2)
+
+
+def test_same_key_with_other_body_conflicts():
+    cache = IdempotencyCache()
+    cache.begin('k', {'message': 'ahoj'})
+    with pytest.raises(IdempotencyConflict):
+        cache.begin('k', {'message': 'nazdar'})
+
+
+def test_key_expires_after_ttl():
+    cache = IdempotencyCache(ttl=0.05)
+    entry, _ = cache.begin('k', {'message': 'ahoj'})
+    cache.finish(entry, {'reply': 'čau'})
+    time.sleep(0.06)
+    _, owner = cache.begin('k', {'message': 'ahoj'})
+    assert owner
+
+
+def test_abandoned_request_runs_again():
+    cache = IdempotencyCache()
+    entry, _ = cache.begin('k', {'message': 'ahoj'})
+    cache.abandon('k', entry)
+    assert cache.wait(entry, 0) is None
+    _, owner = cache.begin('k', {'message': 'ahoj'})
+    assert owner
+
+
+def test_finished_keys_over_the_limit_are_dropped_oldest_first():
+    cache = IdempotencyCache(max_keys=2)
+    running, _ = cache.begin('running', 1)
+    for key in ('a', 'b'):
+        entry, _ = cache.begin(key, 1)
+        cache.finish(entry, key)
+    cache.begin('c', 1)
+    # The running request is the oldest but stays until its TTL so retries can join it
+    assert cache.stats()['keys'] == 4
+    cache.finish(running, 'done')
+    cache.begin('d', 1)
+    assert cache.stats()['keys'] == 2
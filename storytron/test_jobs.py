@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+
+from jobs import ChatJobs
+
+
+def store(directory, job_id, status, key=None):
+    job = {'id': job_id, 'key': key, 'status': status, 'request': {'message': job_id}, 'created': time.time(),
+           'result': None, 'error': None, 'finished': time.time()}
+    with open(os.path.join(directory, f'{job_id}.json'), 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+
+
+def test_same_key_returns_the_running_job(tmp_path):
+    release = threading.Event()
+    calls = []
+
+    def run_turn(data):
+        calls.append(data)
+        release.wait(5)
+        return {'reply': data['message']}
+
+    jobs = ChatJobs(run_turn, directory=str(tmp_path), workers=2)
+    first, created = jobs.submit({'message': 'ahoj'}, key='k')
+    assert created
+    again, created = jobs.submit({'message': 'ahoj'}, key='k')
+    assert again['id'] == first['id'] and not created
+    release.set()
+    assert jobs.get(first['id'], wait=5)['result'] == {'reply': 'ahoj'}
+    assert len(calls) == 1
+
+
+def test_failed_job_is_retried_under_the_same_key(tmp_path):
+    attempts = []
+
+    def run_turn(data):
+        attempts.append(data)
+        if len(attempts) == 1:
+            raise RuntimeError('model down')
+        return {'reply': 'ok'}
+
+    jobs = ChatJobs(run_turn, directory=str(tmp_path))
+    failed, _ = jobs.submit({'message': 'ahoj'}, key='k')
+    assert jobs.get(failed['id'], wait=5)['error'] == 'model down'
+    retry, created = jobs.submit({'message': 'ahoj'}, key='k')
+    assert created and retry['id'] != failed['id']
+    assert jobs.get(retry['id'], wait=5)['status'] == 'done'
+
+
+def test_recovery_runs_queued_and_fails_interrupted_jobs(tmp_path):
+    store(str(tmp_path), 'queued', 'queued', key='kq')
+    store(str(tmp_path), 'running', 'running', key='kr')
+    store(str(tmp_path), 'done', 'done', key='kd')
+    calls = []
+    jobs = ChatJobs(lambda data: calls.append(data) or {'reply': 'ok'}, directory=str(tmp_path))
+    assert jobs.get('queued', wait=5)['status'] == 'done'
+    interrupted = jobs.get('running')
+    assert interrupted['status'] == 'failed' and 'restart' in interrupted['error']
+    # Only the job that never started runs, the interrupted turn is not repeated
+    assert calls == [{'message': 'queued'}]
+    assert jobs.submit({'message': 'done'}, key='kd') == (jobs.get('done'), False)
+
+
+def test_key_of_a_job_run_by_another_process_is_followed_on_disk(tmp_path):
+    store(str(tmp_path), 'elsewhere', 'queued', key='k')
+    with open(os.path.join(str(tmp_path), 'elsewhere.lock'), 'w') as lock:
+        # flock locks conflict between open files even within one process
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        calls = []
+        jobs = ChatJobs(lambda data: calls.append(data), directory=str(tmp_path))
+        deadline = time.monotonic() + 5
+        while 'elsewhere' in jobs._jobs and time.monotonic() < deadline:
+            time.sleep(0.01)
+        job, created = jobs.submit({'message': 'elsewhere'}, key='k')
+        assert job['id'] == 'elsewhere' and not created
+        assert calls == []
+
+
+def test_streamed_pieces_are_followed(tmp_path):
+    sink = {}
+    seen = threading.Event()
+
+    @contextmanager
+    def stream(callback):
+        sink['callback'] = callback
+        yield
+
+    def run_turn(data):
+        for piece in ('Ah', 'oj'):
+            sink['callback'](piece)
+        seen.wait(5)
+        return {'reply': 'Ahoj'}
+
+    jobs = ChatJobs(run_turn, directory=str(tmp_path), stream=stream)
+    job, _ = jobs.submit({'message': 'x'})
+    text = ''
+    while text != 'Ahoj':
+        job, text = jobs.follow(job['id'], 'running', len(text), wait=5)
+        assert job['status'] in ('queued', 'running')
+    seen.set()
+    job, text = jobs.follow(job['id'], 'running', len(text), wait=5)
+    assert job['status'] == 'done' and job['result'] == {'reply': 'Ahoj'}
+    # Streamed text only lives while the job runs
+    assert jobs.follow(job['id'], 'done', 0, wait=0)[1] == ''
@@ -0,0 +1,64 @@
+import os
+from collections import deque
+
+from memory_log import MemoryLog
+
+
+def exchange(i):
+    return {'user': f'u{i}', 'agent': f'a{i}'}
+
+
+def record(log, memory, count, start=0):
+    for i in range(start, start + count):
+        memory.append(exchange(i))
+        log.append(exchange(i), memory)
+
+
+def test_replay_rebuilds_memory_from_the_log(tmp_path):
+    memory = deque(maxlen=10)
+    record(MemoryLog(str(tmp_path), 'aida'), memory, 3)
+    replayed = deque(maxlen=10)
+    log = MemoryLog(str(tmp_path), 'aida')
+    assert log.replay(replayed) == 3
+    assert list(replayed) == list(memory)
+
+
+def test_compaction_writes_a_snapshot_and_empties_the_log(tmp_path):
+    memory = deque(maxlen=3)
+    log = MemoryLog(str(tmp_path), 'aida', compact_events=4)
+    record(log, memory, 5)
+    assert os.path.exists(log.snapshot_path)
+    assert os.path.getsize(log.log_path) > 0
+    replayed = deque(maxlen=3)
+    assert MemoryLog(str(tmp_path), 'aida').replay(replayed) == 1
+    assert list(replayed) == [exchange(2), exchange(3), exchange(4)]
+
+
+def test_events_already_in_the_snapshot_are_skipped(tmp_path):
+    memory = deque(maxlen=10)
+    log = MemoryLog(str(tmp_path), 'aida')
+    record(log, memory, 2)
+    with open(log.log_path, encoding='utf-8') as f:
+        events = f.read()
+    log.compact(memory)
+    # Compaction interrupted after the snapshot but before the log was emptied
+    with open(log.log_path, 'w', encoding='utf-8') as f:
+        f.write(events)
+    replayed = deque(maxlen=10)
+    assert MemoryLog(str(tmp_path), 'aida').replay(replayed) == 0
+    assert list(replayed) == [exchange(0), exchange(1)]
+
+
+def test_torn_last_line_is_cut_before_new_appends(tmp_path):
+    memory = deque(maxlen=10)
+    log = MemoryLog(str(tmp_path), 'aida')
+    record(log, memory, 2)
+    with open(log.log_path, 'a', encoding='utf-8') as f:
+        f.write('{"seq": 3, "exch')
+    reopened = MemoryLog(str(tmp_path), 'aida')
+    replayed = deque(maxlen=10)
+    assert reopened.replay(replayed) == 2
+    record(reopened, replayed, 1, start=2)
+    final = deque(maxlen=10)
+    assert MemoryLog(str(tmp_path), 'aida').replay(final) == 3
+    assert list(final) == [exchange(0), exchange(1), exchange(2)]
@@ -0,0 +1,113 @@
+import os
+import fcntl
+import threading
+
+from sessions import SessionStore
+
+
+class FakeStory:
+    def __init__(self, session_id, state_file):
+        self.session_id = session_id
+        self.state_file = state_file
+        self.closed = False
+
+    def load_state(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def make_store(tmp_path, **kwargs):
+    return SessionStore(FakeStory, str(tmp_path / 'history.jsonl'), directory=str(tmp_path / 'sessions'), **kwargs)
+
+
+def use(store, session_id):
+    with store.use(session_id) as session:
+        return session.story
+
+
+def test_least_recently_used_session_is_evicted(tmp_path):
+    store = make_store(tmp_path, hot=2)
+    a = use(store, 'a')
+    b = use(store, 'b')
+    assert use(store, 'a') is a
+    use(store, 'c')
+    assert store.stats()['hot'] == ['a', 'c']
+    assert b.closed and not a.closed
+    assert store.stats()['evictions'] == 1
+
+
+def test_hot_session_is_reused_and_evicted_one_is_reloaded(tmp_path):
+    store = make_store(tmp_path, hot=1)
+    a = use(store, 'a')
+    assert use(store, 'a') is a
+    use(store, 'b')
+    assert use(store, 'a') is not a
+    assert store.stats()['loads'] == 3 and store.stats()['hits'] == 1
+
+
+def test_idle_sessions_are_evicted(tmp_path):
+    store = make_store(tmp_path, idle=0)
+    use(store, 'a')
+    assert store.stats()['hot'] == []
+
+
+def test_state_changed_by_another_process_reloads(tmp_path):
+    store = make_store(tmp_path)
+    a = use(store, 'a')
+    state_file = store.get('a').state_file
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file, 'w') as f:
+        f.write('{"current_id": "aida"}')
+    assert use(store, 'a') is not a
+    assert a.closed
+
+
+def test_session_in_a_turn_is_not_evicted(tmp_path):
+    store = make_store(tmp_path, hot=1)
+    in_turn = threading.Event()
+    done = threading.Event()
+
+    def turn():
+        with store.use('busy'):
+            in_turn.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=turn)
+    thread.start()
+    in_turn.wait(5)
+    use(store, 'other')
+    assert 'busy' in store.stats()['hot']
+    done.set()
+    thread.join()
+
+
+def test_session_ids_are_validated(tmp_path):
+    store = make_store(tmp_path)
+    assert store.valid('game-1')
+    assert not store.valid('../etc')
+    assert not store.valid('')
+
+
+def test_turn_waits_for_the_session_lock_of_another_process(tmp_path):
+    store = make_store(tmp_path)
+    state_file = store.get('a').state_file
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    entered = threading.Event()
+
+    def turn():
+        with store.use('a'):
+            # Nested use in the same turn does not wait for its own lock
+            with store.use('a'):
+                entered.set()
+
+    with open(f'{state_file}.lock', 'w') as lock:
+        # flock locks conflict between open files even within one process
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        thread = threading.Thread(target=turn)
+        thread.start()
+        assert not entered.wait(0.2)
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    assert entered.wait(5)
+    thread.join()
@@ -0,0 +1,239 @@
+import io
+import os
+import re
+import hashlib
+import json
+import tempfile
+import threading
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import openai
+
+try:
+    from google import genai
+    from google.genai import types
+except ImportError:
+    genai = None
+
+TTS_CACHE_DIR = os.environ.get('STORYTRON_TTS_CACHE_DIR', 'tts_cache')
+TTS_CACHE_MB = float(os.environ.get('STORYTRON_TTS_CACHE_MB', '256'))
+TTS_WORKERS = int(os.environ.get('STORYTRON_TTS_WORKERS', '2'))
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+# Keep in sync with GeminiTtsEngine.AGENT_STYLES in raspitron/tts.py
+AGENT_STYLES = {
+    "dry_gum": "Řekni tajemně chraplavým hlasem: ",
+    "washer_woman": "Řekni svižně: ",
+    "final_boss_2": "Say in a very deep voice, extremely tense and threatening, but briskly: ",
+    "tradicni": "Say in a very relieved, surprised voice, sometimes even flirty, moderately quickly: ",
+}
+
+
+def preprocess_text(text):
+    """Same normalization raspitron applies before synthesis."""
+    return ' '.join(text.lower().replace('*', '').split())
+
+
+def pcm_to_wav(pcm, rate=24000, channels=1, sample_width=2):
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+class TtsSynthesizer:
+    """Server-side synthesis for the network TTS engines off the request path, cached by content hash with LRU eviction."""
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=int(TTS_CACHE_MB * 1024 * 1024), workers=TTS_WORKERS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._openai = None
+        self._gemini = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._pending = {}
+        self._executor = None
+        self._pid = None
+        self.synthesized = 0
+        self.failed = 0
+        self.evicted = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.wav'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((st.st_mtime, name[:-4], st.st_size))
+        for _, digest, size in sorted(found):
+            self._entries[digest] = size
+            self._size += size
+        self._evict()
+
+    @property
+    def engines(self):
+        engines = []
+        if os.environ.get('OPENAI_API_KEY'):
+            engines.append('openai')
+        if genai is not None and os.environ.get('GOOGLE_API_KEY'):
+            engines.append('gemini')
+        return engines
+
+    @staticmethod
+    def digest(engine, voice, agent_id, text):
+        style = AGENT_STYLES.get(agent_id, '') if engine == 'gemini' else ''
+        payload = json.dumps([engine, voice or '', style, text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}.wav')
+
+    def _pool(self):
+        # Forked server workers do not inherit the parent's threads
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tts')
+            self._pending = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, text, agent_id, engine, voice):
+        """Digest the audio will be served under, synthesis runs in the background on a miss."""
+        if engine not in self.engines:
+            return None
+        text = preprocess_text(text)
+        if not text:
+            return None
+
+        digest = self.digest(engine, voice, agent_id, text)
+        with self._lock:
+            pool = self._pool()
+            if digest in self._pending or (digest in self._entries and os.path.exists(self.path(digest))):
+                return digest
+            future = pool.submit(self._synthesize, digest, text, agent_id, engine, voice)
+            self._pending[digest] = future
+        future.add_done_callback(lambda f: self._done(digest))
+        return digest
+
+    def _done(self, digest):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def _synthesize(self, digest, text, agent_id, engine, voice):
+        try:
+            if engine == 'openai':
+                data = self._synthesize_openai(text, voice)
+            else:
+                data = self._synthesize_gemini(text, agent_id, voice)
+            self._store(digest, data)
+        except Exception as e:
+            self.failed += 1
+            print(f"Server TTS error: {e}")
+            return
+        self.synthesized += 1
+
+    def pending(self, digest):
+        with self._lock:
+            return self._pid == os.getpid() and digest in self._pending
+
+    def audio(self, digest, wait=0):
+        """Path of the cached audio, waits up to `wait` seconds for a synthesis in progress, None if missing."""
+        with self._lock:
+            future = self._pending.get(digest) if self._pid == os.getpid() else None
+        if future is not None:
+            try:
+                future.result(timeout=wait)
+            except FutureTimeout:
+                return None
+        path = self.path(digest)
+        with self._lock:
+            try:
+                # Touch for the LRU order a restart rebuilds from mtimes
+                os.utime(path)
+            except OSError:
+                self._size -= self._entries.pop(digest, 0)
+                return None
+            if digest not in self._entries:
+                # Written by another server process
+                self._entries[digest] = os.path.getsize(path)
+                self._size += self._entries[digest]
+            self._entries.move_to_end(digest)
+        return path
+
+    def _store(self, digest, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(digest))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._size -= self._entries.pop(digest, 0)
+            self._entries[digest] = len(data)
+            self._size += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            digest, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evicted += 1
+            try:
+                os.remove(self.path(digest))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'pending': len(self._pending) if self._pid == os.getpid() else 0,
+                'synthesized': self.synthesized,
+                'failed': self.failed,
+                'evicted': self.evicted,
+            }
+
+    def _synthesize_openai(self, text, voice):
+        if self._openai is None:
+            self._openai = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'), timeout=45, max_retries=1)
+        response = self._openai.audio.speech.create(
+            model="tts-1",
+            voice=voice or "alloy",
+            input=text,
+            response_format="wav"
+        )
+        return response.content
+
+    def _synthesize_gemini(self, text, agent_id, voice):
+        if self._gemini is None:
+            self._gemini = genai.Client(api_key=os.environ.get('GOOGLE_API_KEY'))
+        response = self._gemini.models.generate_content(
+            model="gemini-2.5-flash-preview-tts",
+            contents=AGENT_STYLES.get(agent_id, '') + text,
+            config=types.GenerateContentConfig(
+                response_modalities=["AUDIO"],
+                speech_config=types.SpeechConfig(
+                    voice_config=types.VoiceConfig(
+                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                            voice_name=voice or "Kore",
+                        )
+                    )
+                ),
+            )
+        )
+        return pcm_to_wav(response.candidates[0].content.parts[0].inline_data.data)
@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+
+# USD per million tokens as (input, cached input, output), reasoning tokens are billed as output
+MODEL_PRICES = {
+    'gpt-5-mini': (0.25, 0.025, 2.00),
+    'gpt-5-nano': (0.05, 0.005, 0.40),
+}
+MODEL_PRICES.update({model: tuple(prices) for model, prices
+                     in json.loads(os.environ.get('STORYTRON_MODEL_PRICES', '{}')).items()})
+
+# Spend per session in USD, 0 disables the budget
+SESSION_BUDGET = float(os.environ.get('STORYTRON_SESSION_BUDGET', '0'))
+# Fractions of the budget after which the context is shortened and then the cheaper model used
+BUDGET_TRIM_AT = float(os.environ.get('STORYTRON_BUDGET_TRIM_AT', '0.5'))
+BUDGET_CHEAP_AT = float(os.environ.get('STORYTRON_BUDGET_CHEAP_AT', '0.8'))
+CHEAP_MODEL = os.environ.get('STORYTRON_CHEAP_MODEL', 'gpt-5-nano')
+# Exchanges of conversation history kept once the context is shortened
+TRIM_EXCHANGES = int(os.environ.get('STORYTRON_TRIM_EXCHANGES', '4'))
+
+LEVELS = ('normal', 'trim', 'cheap', 'capped')
+
+
+class BudgetExceeded(Exception):
+    """The session spent its whole budget, no more model calls are made."""
+
+
+def usage_record(model, input_tokens, output_tokens, latency, cached_input_tokens=0, reasoning_tokens=0):
+    result = {
+        'model': model,
+        'input_tokens': input_tokens,
+        'cached_input_tokens': cached_input_tokens,
+        'output_tokens': output_tokens,
+        'reasoning_tokens': reasoning_tokens,
+        'latency_ms': round(latency * 1000),
+    }
+    result['cost_usd'] = cost(result)
+    return result
+
+
+def usage_from_response(response, model, latency):
+    """Token counts and cost of one responses.create call."""
+    usage = getattr(response, 'usage', None)
+    input_details = getattr(usage, 'input_tokens_details', None)
+    output_details = getattr(usage, 'output_tokens_details', None)
+    return usage_record(model, getattr(usage, 'input_tokens', 0) or 0, getattr(usage, 'output_tokens', 0) or 0,
+                        latency, cached_input_tokens=getattr(input_details, 'cached_tokens', 0) or 0,
+                        reasoning_tokens=getattr(output_details, 'reasoning_tokens', 0) or 0)
+
+
+def cost(usage):
+    price_input, price_cached, price_output = MODEL_PRICES.get(usage['model'], (0.0, 0.0, 0.0))
+    uncached = usage['input_tokens'] - usage['cached_input_tokens']
+    return (uncached * price_input + usage['cached_input_tokens'] * price_cached
+            + usage['output_tokens'] * price_output) / 1e6
+
+
+def _empty():
+    return {'calls': 0, 'input_tokens': 0, 'cached_input_tokens': 0, 'output_tokens': 0,
+            'reasoning_tokens': 0, 'latency_ms': 0, 'cost_usd': 0.0}
+
+
+class UsageLedger:
+    """Usage totals per session and agent since the server started."""
+
+    def __init__(self, budget=SESSION_BUDGET, trim_at=BUDGET_TRIM_AT, cheap_at=BUDGET_CHEAP_AT):
+        self.budget = budget
+        self.trim_at = trim_at
+        self.cheap_at = cheap_at
+        self._lock = threading.Lock()
+        self._totals = {}
+        self.degraded_calls = {level: 0 for level in LEVELS}
+
+    def record(self, session_id, agent_id, usage):
+        with self._lock:
+            totals = self._totals.setdefault(session_id, {}).setdefault(agent_id, _empty())
+            totals['calls'] += 1
+            for field in ('input_tokens', 'cached_input_tokens', 'output_tokens', 'reasoning_tokens',
+                          'latency_ms', 'cost_usd'):
+                totals[field] += usage[field]
+
+    def spent(self, session_id):
+        with self._lock:
+            return sum(totals['cost_usd'] for totals in self._totals.get(session_id, {}).values())
+
+    def level(self, session_id):
+        if not self.budget:
+            return 'normal'
+        used = self.spent(session_id) / self.budget
+        if used >= 1:
+            return 'capped'
+        if used >= self.cheap_at:
+            return 'cheap'
+        if used >= self.trim_at:
+            return 'trim'
+        return 'normal'
+
+    def session_view(self, session_id):
+        """Per agent totals of one session with the spend against the budget."""
+        with self._lock:
+            agents = {agent_id: dict(totals) for agent_id, totals in self._totals.get(session_id, {}).items()}
+        for totals in agents.values():
+            totals['latency_mean_ms'] = totals['latency_ms'] / totals['calls'] if totals['calls'] else None
+        return {
+            'session': session_id,
+            'spent_usd': sum(totals['cost_usd'] for totals in agents.values()),
+            'budget_usd': self.budget or None,
+            'level': self.level(session_id),
+            'agents': agents,
+        }
+
+    def snapshot(self):
+        with self._lock:
+            session_ids = list(self._totals)
+            degraded = dict(self.degraded_calls)
+        return {'sessions': [self.session_view(session_id) for session_id in session_ids],
+                'calls_by_level': degraded}
+
+    def for_session(self, session_id):
+        return SessionBudget(self, session_id)
+
+
+class SessionBudget:
+    """What an agent of one session may spend on its next call."""
+
+    def __init__(self, ledger, session_id):
+        self.ledger = ledger
+        self.session_id = session_id
+
+    def plan(self, model, messages):
+        """Model and input for the next call, degraded as the session nears its budget."""
+        level = self.ledger.level(self.session_id)
+        with self.ledger._lock:
+            self.ledger.degraded_calls[level] += 1
+        if level == 'capped':
+            raise BudgetExceeded(f'Session {self.session_id} spent its budget of {self.ledger.budget} USD')
+        if level in ('trim', 'cheap'):
+            # Keep the leading system prompt and the newest exchanges with the current message
+            head = messages[:1] if messages and messages[0]['role'] == 'system' else []
+            messages = head + messages[len(head):][-(2 * TRIM_EXCHANGES + 1):]
+        if level == 'cheap':
+            model = CHEAP_MODEL
+        return model, messages
+
+    def record(self, agent_id, usage):
+        self.ledger.record(self.session_id, agent_id, usage)